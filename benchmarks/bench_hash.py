@@ -0,0 +1,73 @@
+import os, random, string, tempfile
+from synthetic import setup, best, make_bin
+
+# name hashing: per string python loops vs numpy batch vs memo,
+# then BIN write and hash extraction that use them
+# usage: python benchmarks/bench_hash.py [--src old/src]
+# before/after: run once more with --src of a checkout before the change
+
+args = setup('hash helper benchmark')
+from Tools.pyRitoFile import helper
+from xxhash import xxh64
+
+print(f'numpy: {helper.numpy != None if hasattr(helper, "numpy") else "not used"}')
+rng = random.Random(3)
+unique = [f'assets/characters/c{i % 170}/skins/skin{i % 30}/particles/p{i}.dds' for i in range(100000)]
+repeated = [f'field{i % 300}' for i in range(200000)]
+# random names of every length, for the batch == scalar check
+mixed = [''.join(rng.choice(string.ascii_letters + string.digits + '/_.') for _ in range(rng.randint(0, 200))) for _ in range(20000)]
+
+for name in ('FNV1a', 'FNV1', 'Elf'):
+    func = getattr(helper, name)
+    # the per string loop without its memo
+    scalar = getattr(func, '__wrapped__', func)
+    line = f'{name:6} 100k unique: scalar {best(lambda: [scalar(s) for s in unique], args.repeat):.3f} s'
+    batch = getattr(helper, f'{name}_batch', None)
+    if batch != None:
+        assert batch(mixed) == [scalar(s) for s in mixed], name
+        line += f', batch {best(lambda: batch(unique), args.repeat):.3f} s'
+    print(line)
+
+FNV1a = helper.FNV1a
+scalar = getattr(FNV1a, '__wrapped__', FNV1a)
+line = f'FNV1a  200k repeated names: scalar {best(lambda: [scalar(s) for s in repeated], args.repeat):.3f} s'
+if hasattr(FNV1a, 'cache_clear'):
+    line += f', memo {best(lambda: [FNV1a(s) for s in repeated], args.repeat):.3f} s'
+print(line)
+
+line = f'xxh64  100k paths: xxh64 object {best(lambda: [xxh64(s.lower()).intdigest() for s in unique], args.repeat):.3f} s'
+if hasattr(helper, 'XXH64_batch'):
+    line += f', batch {best(lambda: helper.XXH64_batch(unique), args.repeat):.3f} s'
+print(line)
+
+bin = make_bin()
+data = bin.write('', raw=True)
+print(f'BIN.write 3000 entries: {best(lambda: bin.write("", raw=True), args.repeat):.3f} s')
+
+# extraction needs the app config (Core, qfluentwidgets)
+try:
+    from Tools import hash_helper
+except ImportError as e:
+    print(f'hash extraction: skipped, {e}')
+else:
+    with tempfile.TemporaryDirectory() as dir:
+        for name in ('cdtb', 'extracted', 'custom'):
+            os.makedirs(f'{dir}/{name}')
+        hash_helper.CDTBHashes.local_dir = f'{dir}/cdtb'
+        hash_helper.ExtractedHashes.local_dir = f'{dir}/extracted'
+        hash_helper.CustomHashes.local_dir = f'{dir}/custom'
+        bin_files = []
+        for i in range(8):
+            bin_files.append(f'{dir}/skin{i}.bin')
+            with open(bin_files[-1], 'wb') as f:
+                f.write(data)
+
+        def extract():
+            for name in os.listdir(f'{dir}/extracted'):
+                os.remove(f'{dir}/extracted/{name}')
+            hash_helper.ExtractedHashes.extract(*bin_files)
+
+        import contextlib, io
+        with contextlib.redirect_stdout(io.StringIO()):
+            t = best(extract, args.repeat)
+        print(f'hash extraction 8 bins: {t:.3f} s')
@@ -0,0 +1,42 @@
+import timeit
+from synthetic import setup, best, make_skl
+
+# C string readers/writers: SKL joint names, wem names, raw memoryview input
+# usage: python benchmarks/bench_strings.py [--src old/src]
+# before/after: run once more with --src of a checkout before the change
+
+args = setup('BytesStream string benchmark')
+from Tools.pyRitoFile import skl
+from Tools.pyRitoFile.stream import BytesStream
+
+data = make_skl().write('', raw=True)
+print(f'skl: 800 joints, {len(data)} bytes')
+print(f'SKL.read          {best(lambda: skl.SKL().read(data, raw=True), args.repeat) * 1000:8.2f} ms')
+print(f'SKL write after read identical: {skl.SKL().read(data, raw=True).write("", raw=True) == data}')
+
+count = 20000
+name_offset = data.find(b'Buffbone_Glb_Channel_Loc_Joint_0000')
+bs = BytesStream.reader(data, raw=True)
+t = min(timeit.repeat(lambda: (bs.seek(name_offset), bs.read_c_until0()), number=count, repeat=args.repeat)) / count
+print(f'read_c_until0     {t * 1e6:8.2f} us/name')
+
+writer = BytesStream.writer('', raw=True)
+t = min(timeit.repeat(lambda: writer.write_c_sep_0('1234567890.wem'), number=count, repeat=args.repeat)) / count
+print(f'write_c_sep_0     {t * 1e6:8.2f} us/wem name')
+wem_names = BytesStream.writer('', raw=True)
+wem_names.write_c_sep_0('1234567890.wem')
+bs = BytesStream.reader(wem_names.raw(), raw=True)
+t = min(timeit.repeat(lambda: (bs.seek(0), bs.read_c_sep_0(14)), number=count, repeat=args.repeat)) / count
+print(f'read_c_sep_0      {t * 1e6:8.2f} us/wem name')
+
+# raw memoryview input (ex: a chunk inside a mapped wad) must not be copied
+big = bytearray(64 * 1024**2)
+big[-6:] = b'name\x00\x00'
+view = memoryview(big)
+
+def read_last_name():
+    bs = BytesStream.reader(view, raw=True)
+    bs.seek(len(big) - 6)
+    return bs.read_c_until0()
+
+print(f'memoryview 64 MB  {best(read_last_name, args.repeat) * 1000:8.2f} ms to open and read one name')
@@ -0,0 +1,25 @@
+import hashlib, timeit
+from synthetic import setup, best, make_bin
+
+# BytesStream per call cost and BIN read/write on a champion style bin
+# usage: python benchmarks/bench_struct.py [--src old/src]
+# before/after: run once more with --src of a checkout before the cache
+
+args = setup('BytesStream struct cache benchmark')
+from Tools.pyRitoFile import bin
+from Tools.pyRitoFile.stream import BytesStream
+
+data = make_bin().write('', raw=True)
+print(f'bin: {len(data)} bytes, md5 {hashlib.md5(data).hexdigest()}')
+
+bs = BytesStream.reader(data, raw=True)
+count = 200000
+for name in ('read_u32', 'read_f32', 'read_vec3'):
+    func = getattr(bs, name)
+    t = min(timeit.repeat(lambda: (bs.seek(0), func()), number=count, repeat=args.repeat)) / count
+    print(f'{name:10} {t * 1e9:6.0f} ns/call')
+
+print(f'BIN.read   {best(lambda: bin.BIN().read(data, raw=True), args.repeat) * 1000:6.0f} ms')
+parsed = bin.BIN().read(data, raw=True)
+print(f'BIN.write  {best(lambda: parsed.write("", raw=True), args.repeat) * 1000:6.0f} ms')
+print(f'BIN.write output identical: {parsed.write("", raw=True) == data}')
@@ -0,0 +1,76 @@
+import os, sys, random, argparse
+
+# shared by the benchmarks: path setup and synthetic game files
+# run a benchmark against another checkout to compare: --src path/to/old/src
+
+
+def setup(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--src', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'),
+                        help='src folder to benchmark, default: this checkout')
+    parser.add_argument('--repeat', type=int, default=5, help='best of')
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.abspath(args.src))
+    print(f'src: {os.path.abspath(args.src)}')
+    return args
+
+
+def best(func, repeat):
+    # best wall time of repeat runs, in seconds
+    from time import perf_counter
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def make_bin(entries=3000, fields=13):
+    # champion style bin: ~1.3 MB for 3000 entries of 13 fields
+    from Tools.pyRitoFile import bin
+    from Tools.pyRitoFile.structs import Vector
+    rng = random.Random(1)
+    T = bin.BINType
+
+    def field(i):
+        kind = i % 7
+        hash = f'field{i % 300}'
+        if kind == 0:
+            return bin.BINField(hash=hash, type=T.F32, data=rng.random())
+        if kind == 1:
+            return bin.BINField(hash=hash, type=T.VEC3, data=Vector(1.0, 2.0, 3.0))
+        if kind == 2:
+            return bin.BINField(hash=hash, type=T.STRING, data=f'assets/characters/ahri/skins/skin0{i % 9}/particles/p{i}.dds')
+        if kind == 3:
+            return bin.BINField(hash=hash, type=T.LIST, value_type=T.U32, data=list(range(10)))
+        if kind == 4:
+            return bin.BINField(hash=hash, type=T.EMBED, hash_type='ValueFloat', data=[
+                bin.BINField(hash='constantValue', type=T.F32, data=0.5),
+                bin.BINField(hash='dynamics', type=T.U8, data=1)
+            ])
+        if kind == 5:
+            return bin.BINField(hash=hash, type=T.MAP, key_type=T.HASH, value_type=T.STRING, data={f'k{j}': f'v{j}' for j in range(4)})
+        return bin.BINField(hash=hash, type=T.HASH, data=f'name{i % 50}')
+
+    return bin.BIN(
+        signature='PROP', version=3, links=['data/a.bin'], patches=[],
+        entries=[
+            bin.BINEntry(hash=f'Characters/Ahri/Entry{e}', type='VfxSystemDefinitionData', data=[field(e * fields + i) for i in range(fields)])
+            for e in range(entries)
+        ]
+    )
+
+
+def make_skl(joints=800):
+    # joint names of 45 chars
+    from Tools.pyRitoFile import skl
+    from Tools.pyRitoFile.structs import Vector, Quaternion
+    return skl.SKL(joints=[
+        skl.SKLJoint(
+            name=f'Buffbone_Glb_Channel_Loc_Joint_{i:04d}_Long_Name', parent=i - 1, hash=i, radius=1.0,
+            local_translate=Vector(1.0, 2.0, 3.0), local_scale=Vector(1.0, 1.0, 1.0), local_rotate=Quaternion(0.0, 0.0, 0.0, 1.0),
+            ibind_translate=Vector(1.0, 2.0, 3.0), ibind_scale=Vector(1.0, 1.0, 1.0), ibind_rotate=Quaternion(0.0, 0.0, 0.0, 1.0)
+        )
+        for i in range(joints)
+    ])
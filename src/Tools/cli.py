@@ -7,10 +7,20 @@ def parse_arguments():
         prog='LtMAO command line interface',
         description='LtMAO stuffs here.')
     parser.add_argument('-t', '--tool', type=str,
-                        help='Which tool to use: wadpack, wadunpack')
+                        help='Which tool to use: wadpack, wadunpack, wadcompact, wadindex, wadverify, hashguess')
     parser.add_argument('-src', '--source', type=str, help='Input file')
     parser.add_argument('-dst', '--destination',
                         type=str, help='Output file')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Worker threads for wad tools, worker processes for hashextract, hashguess')
+    parser.add_argument('-l', '--level', type=int, default=None,
+                        help='Zstd compression level for wadpack')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Only recompress files changed since last wadpack')
+    parser.add_argument('-f', '--filter', type=str, nargs='*', default=None,
+                        help='Glob patterns for wadunpack, ex: *.skn data/characters/ahri/**')
+    parser.add_argument('-c', '--combine', action='store_true',
+                        help='Also try every known dir with every known file name for hashguess (slow)')
     if len(sys.argv) == 1:
         parser.print_help()
         input()
@@ -25,7 +35,7 @@ def ensure_curdir():
 
 class CLI:
     @staticmethod
-    def wadpack(src, dst):
+    def wadpack(src, dst, jobs=1, level=None, incremental=False):
         from LtMAO import wad_tool
         if dst == None:
             dst = src
@@ -34,19 +44,19 @@ class CLI:
             else:
                 if not dst.endswith('.wad.client'):
                     dst += '.wad.client'
-        wad_tool.pack(src, dst)
+        wad_tool.pack(src, dst, jobs=jobs, level=level, incremental=incremental)
 
     @staticmethod
-    def wadunpack(src, dst):
+    def wadunpack(src, dst, jobs=1, patterns=None):
         from LtMAO import lepath, wad_tool, hash_helper
         if dst == None:
             dst = lepath.ext(src, '.wad.client', '.wad')
         hash_helper.Storage.read_wad_hashes()
-        wad_tool.unpack(src, dst, hash_helper.Storage.hashtables)
+        wad_tool.unpack(src, dst, hash_helper.Storage.hashtables, jobs=jobs, patterns=patterns)
         hash_helper.Storage.free_wad_hashes()
 
     @staticmethod
-    def wadunpack_all(src, dst):
+    def wadunpack_all(src, dst, jobs=1, patterns=None):
         from LtMAO import lepath, wad_tool, hash_helper
         import os
         hash_helper.Storage.read_wad_hashes()
@@ -55,9 +65,27 @@ class CLI:
                 if file.endswith('.wad.client'):
                     wad = lepath.join(root, file)
                     dir = lepath.ext(wad, '.wad.client', '.wad')
-                    wad_tool.unpack(wad, dir, hash_helper.Storage.hashtables)
+                    wad_tool.unpack(wad, dir, hash_helper.Storage.hashtables, jobs=jobs, patterns=patterns)
         hash_helper.Storage.free_wad_hashes()
 
+    @staticmethod
+    def wadverify(src, jobs=1):
+        from LtMAO import wad_tool
+        if len(wad_tool.verify(src, jobs)) > 0:
+            sys.exit(1)
+
+    @staticmethod
+    def wadcompact(src):
+        from LtMAO import wad_tool
+        wad_tool.compact(src)
+
+    @staticmethod
+    def wadindex(src, dst, jobs=1):
+        from LtMAO import wad_index
+        index = wad_index.WADIndex(dst, src) if dst != None else wad_index.WADIndex.default(src)
+        with index:
+            index.update(jobs)
+
     @staticmethod
     def ritobin(src, dst):
         from LtMAO import lepath, hash_helper, pyRitoFile, tools
@@ -128,7 +156,7 @@ class CLI:
         uvee.uvee_file(src)
 
     @staticmethod
-    def hashextract(src):
+    def hashextract(src, jobs=1):
         from LtMAO import lepath, hash_helper
         import os
         import os.path
@@ -137,9 +165,14 @@ class CLI:
             for root, dirs, files in os.walk(src):
                 for file in files:
                     file_paths.append(lepath.join(root, file))
-            hash_helper.ExtractedHashes.extract(*file_paths)
+            hash_helper.ExtractedHashes.extract(*file_paths, jobs=jobs)
         else:
-            hash_helper.ExtractedHashes.extract(src)
+            hash_helper.ExtractedHashes.extract(src, jobs=jobs)
+
+    @staticmethod
+    def hashguess(src, jobs=1, combine=False):
+        from LtMAO import hash_guesser
+        hash_guesser.guess_dir(src, rules=hash_guesser.GuessRules(combine=combine), jobs=jobs)
 
     @staticmethod
     def pyntex(src, delete_junk_files=False):
@@ -394,10 +427,14 @@ class CLI:
         
 
 def main():
+    args = parse_arguments()
     funcs = {
-        'wadpack':          lambda src, dst: CLI.wadpack(src, dst),
-        'wadunpack':        lambda src, dst: CLI.wadunpack(src, dst),
-        'wadunpack_all':    lambda src, dst: CLI.wadunpack_all(src, dst),
+        'wadpack':          lambda src, dst: CLI.wadpack(src, dst, args.jobs, args.level, args.incremental),
+        'wadunpack':        lambda src, dst: CLI.wadunpack(src, dst, args.jobs, args.filter),
+        'wadunpack_all':    lambda src, dst: CLI.wadunpack_all(src, dst, args.jobs, args.filter),
+        'wadcompact':       lambda src, dst: CLI.wadcompact(src),
+        'wadverify':        lambda src, dst: CLI.wadverify(src, args.jobs),
+        'wadindex':         lambda src, dst: CLI.wadindex(src, dst, args.jobs),
 
         'ritobin':          lambda src, dst: CLI.ritobin(src, dst),
         'ritobindir2py':    lambda src, dst: CLI.ritobindir(src, dst, True),
@@ -407,7 +444,8 @@ def main():
 
         'uvee':             lambda src, dst: CLI.uvee(src),
 
-        'hashextract':      lambda src, dst: CLI.hashextract(src),
+        'hashextract':      lambda src, dst: CLI.hashextract(src, args.jobs),
+        'hashguess':        lambda src, dst: CLI.hashguess(src, args.jobs, args.combine),
 
         'pyntex':           lambda src, dst: CLI.pyntex(src),
         'pyntexdeljunk':    lambda src, dst: CLI.pyntex(src, True),
@@ -445,11 +483,12 @@ def main():
         'infinityQT':         lambda src, dst: CLI.infinityQT(src),
     }
 
-    args = parse_arguments()
     ensure_curdir()
     funcs[args.tool](args.source, args.destination)
 
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()
     try:
         main()
         sys.exit(0)
@@ -66,11 +66,10 @@ def inspect(path, hashtables=None):
     elif file_type == 'wad':
         obj = pyRitoFile.wad.WAD().read(path)
         obj.un_hash(hashtables)
-        # read chunk data to guess extension (incase poor unhash)
+        # probe chunk data to guess extension (incase poor unhash)
         with pyRitoFile.stream.BytesStream.reader(path) as bs:
             for chunk in obj.chunks:
-                chunk.read_data(bs)
-                chunk.free_data()
+                chunk.probe_extension(bs)
         print(f'file_inspector: Finish: Read WAD: {path}')
     else:
         raise Exception(f'file_inspector: Error: Read: {path}: Unknown file type')
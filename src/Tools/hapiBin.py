@@ -88,38 +88,41 @@ class Helper:
                     map_bin_src_dst[src_bin_path] = (None, pyRitoFile.bin.BIN().read(src_bin_path), None)
             # match bin in wads
             for src_wad_path in src_wad_paths:
-                src_wad = pyRitoFile.wad.WAD().read(src_wad_path)
+                dst_wad = None
                 if require_dst:
                     dst_wad_path = lepath.join(dst, lepath.rel(src_wad_path, src))
-                    dst_wad = pyRitoFile.wad.WAD().read(dst_wad_path)
+                    # only open dst toc, dst bins are read by hash when src has them
+                    dst_wad = pyRitoFile.wad.WAD.open(dst_wad_path)
                     map_wad_src_dst[src_wad_path] = (dst_wad_path, [])
-                    dst_bins = {}
-                    with pyRitoFile.stream.BytesStream.reader(dst_wad_path) as bs:
-                        for dst_chunk in dst_wad.chunks:
-                            dst_chunk.read_data(bs)
-                            if dst_chunk.extension == 'bin':
-                                dst_bins[dst_chunk.hash] = pyRitoFile.bin.BIN().read(dst_chunk.data, raw=True)
-                            dst_chunk.free_data()
                 else:
                      map_wad_src_dst[src_wad_path] = (None, [])
-                with pyRitoFile.stream.BytesStream.reader(src_wad_path) as bs:
-                    for src_chunk in src_wad.chunks:
-                        src_chunk.read_data(bs)
-                        if src_chunk.extension == 'bin': 
-                            if require_dst:
-                                if src_chunk.hash in dst_bins:
+                try:
+                    with pyRitoFile.wad.WAD.open(src_wad_path) as src_wad:
+                        for src_chunk in src_wad:
+                            if require_dst and src_chunk.hash not in dst_wad:
+                                continue
+                            src_chunk.read_data(src_wad.bs)
+                            if src_chunk.extension == 'bin': 
+                                if require_dst:
+                                    dst_chunk = dst_wad.read_data(src_chunk.hash)
+                                    if dst_chunk.extension == 'bin':
+                                        map_wad_src_dst[src_wad_path][1].append((
+                                            src_chunk.hash,
+                                            pyRitoFile.bin.BIN().read(src_chunk.data, raw=True), 
+                                            pyRitoFile.bin.BIN().read(dst_chunk.data, raw=True)
+                                        ))
+                                    dst_chunk.free_data()
+                                else:
                                     map_wad_src_dst[src_wad_path][1].append((
                                         src_chunk.hash,
                                         pyRitoFile.bin.BIN().read(src_chunk.data, raw=True), 
-                                        dst_bins[src_chunk.hash]
+                                        None,
                                     ))
-                            else:
-                                map_wad_src_dst[src_wad_path][1].append((
-                                    src_chunk.hash,
-                                    pyRitoFile.bin.BIN().read(src_chunk.data, raw=True), 
-                                    None,
-                                ))
-                        src_chunk.free_data()
+                            src_chunk.free_data()
+                finally:
+                    # close dst toc even if a bin fails to read
+                    if dst_wad != None:
+                        dst_wad.close()
         return map_bin_src_dst, map_wad_src_dst
 
     @staticmethod
@@ -139,12 +142,10 @@ class Helper:
                 map_wad_datas[chunk_hash] = dst_bin if require_dst else src_bin
 
             wad_path = dst_wad_path if require_dst else src_wad_path
-            wad = pyRitoFile.wad.WAD().read(wad_path)
-            with pyRitoFile.stream.BytesStream.updater(wad_path) as bs:
-                for chunk in wad.chunks:
-                    if chunk.hash in map_wad_datas:
-                        chunk.write_data(bs, chunk.id, chunk.hash, map_wad_datas[chunk.hash].write('', raw=True))
-                        chunk.free_data()
+            # overwrite in place when it fits, so the wad dont grow on every edit
+            with pyRitoFile.wad.WADPatcher(wad_path) as patcher:
+                for chunk_hash in map_wad_datas:
+                    patcher.replace(chunk_hash, map_wad_datas[chunk_hash].write('', raw=True))
         print(f'hapiBin: Finish: Write source & target.')
 
     @staticmethod
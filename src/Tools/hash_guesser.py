@@ -0,0 +1,235 @@
+from . import lepath, pyRitoFile, hash_helper
+from .pyRitoFile.helper import XXH64_batch
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import re
+
+# 未知wad路径哈希猜测
+
+DEFAULT_EXTENSIONS = {
+    'dds': ('tex', 'png'),
+    'tex': ('dds', 'png'),
+    'png': ('dds', 'tex'),
+    'skn': ('skl',),
+    'skl': ('skn',),
+    'bnk': ('wpk',),
+    'wpk': ('bnk',),
+    'bin': ('py',),
+}
+DEFAULT_LANGUAGES = (
+    'en_us', 'ar_ae', 'cs_cz', 'de_de', 'el_gr', 'en_au', 'en_gb', 'en_ph',
+    'en_sg', 'es_ar', 'es_es', 'es_mx', 'fr_fr', 'hu_hu', 'id_id', 'it_it',
+    'ja_jp', 'ko_kr', 'pl_pl', 'pt_br', 'ro_ro', 'ru_ru', 'th_th', 'tr_tr',
+    'vi_vn', 'zh_cn', 'zh_my', 'zh_tw'
+)
+# every number right after "skin": skins/skin01/, skin1.bin
+SKIN_RE = re.compile(r'(?<=skin)\d+')
+# base skin parts: skins/base/, ahri_base_tx_cm.dds
+BASE_RE = re.compile(r'(?<=[/_])base(?=[/_.])')
+# locale parts: .../en_us/..., ..._en_us.bnk
+LANGUAGE_RE = re.compile(r'(?<![a-z])[a-z]{2}_[a-z]{2}(?![a-z])')
+# seeds per task, candidates per combine task
+TASK_SEEDS = 256
+TASK_COMBINES = 200000
+
+
+class GuessRules:
+    # how candidates are made from a known path, each rule multiply the variants:
+    # skins: skin numbers to try, as 1 and 01, base <-> skinNN
+    # extensions: ext -> other exts to try
+    # languages: locales to swap with the one in the path
+    # scales: prefixes for dds/tex file names, ex: 2x_
+    # prefixes: extra dirs combined with every known file name
+    # combine: combine every known dir with every known file name,
+    # off by default: dirs x names candidates, can be billions on a full game folder
+    __slots__ = ('skins', 'extensions', 'languages', 'scales', 'prefixes', 'combine')
+
+    def __init__(self, skins=range(100), extensions=None, languages=None, scales=('2x_', '4x_'), prefixes=(), combine=False):
+        self.skins = skins
+        self.extensions = DEFAULT_EXTENSIONS if extensions == None else extensions
+        self.languages = DEFAULT_LANGUAGES if languages == None else languages
+        self.scales = scales
+        self.prefixes = prefixes
+        self.combine = combine
+
+
+def skin_variants(path, rules):
+    if SKIN_RE.search(path) == None and BASE_RE.search(path) == None:
+        return (path,)
+    # \x00: where the skin number goes
+    # numbers only, numbers + skins/base/ folder, numbers + every base part
+    numbered = SKIN_RE.sub('\x00', path)
+    templates = set((
+        numbered,
+        numbered.replace('/skins/base/', '/skins/skin\x00/'),
+        BASE_RE.sub('skin\x00', numbered)
+    ))
+    variants = {path}
+    for template in templates:
+        if '\x00' not in template:
+            continue
+        for skin in rules.skins:
+            variants.add(template.replace('\x00', str(skin)))
+            variants.add(template.replace('\x00', f'{skin:02}'))
+        variants.add(template.replace('skin\x00', 'base'))
+    return variants
+
+
+def language_variants(path, rules):
+    languages = [match for match in LANGUAGE_RE.finditer(path) if match.group() in rules.languages]
+    if len(languages) == 0:
+        return (path,)
+    start, end = languages[-1].span()
+    return [path[:start] + language + path[end:] for language in rules.languages]
+
+
+def extension_variants(path, rules):
+    name, _, extension = path.rpartition('.')
+    if extension not in rules.extensions:
+        return (path,)
+    return [path] + [f'{name}.{other}' for other in rules.extensions[extension]]
+
+
+def scale_variants(path, rules):
+    if not path.endswith(('.dds', '.tex')):
+        return (path,)
+    dirname, _, basename = path.rpartition('/')
+    return [path] + [f'{dirname}/{scale}{basename}' for scale in rules.scales]
+
+
+VARIANT_FUNCS = (skin_variants, language_variants, extension_variants, scale_variants)
+
+
+def candidates(path, rules):
+    variants = {path}
+    for func in VARIANT_FUNCS:
+        variants = set(variant for old in variants for variant in func(old, rules))
+    return variants
+
+
+# worker state, set once per process (a pool per round)
+UNKNOWN = None
+NAMES = None
+RULES = None
+
+def init_worker(unknown, names, rules):
+    # names: {'names': all known file names, 'new_names': names new this round}
+    global UNKNOWN, NAMES, RULES
+    UNKNOWN = unknown
+    NAMES = names
+    RULES = rules
+
+
+def guess_task(task):
+    # ('seeds', paths) or ('names' / 'new_names', dirs) combined with NAMES[kind]
+    # -> (candidate count, [(hash, path)] of unknown hashes)
+    kind, items = task
+    if kind == 'seeds':
+        paths = set()
+        for item in items:
+            paths.update(candidates(item, RULES))
+    else:
+        paths = set(f'{dir}/{name}' for dir in items for name in NAMES[kind])
+    paths = list(paths)
+    return len(paths), [(hash, path) for hash, path in zip(XXH64_batch(paths), paths) if hash in UNKNOWN]
+
+
+def read_wads(wad_files):
+    # -> (unknown hashes, known lower paths) of wads
+    unknown = set()
+    seeds = set()
+    hash_helper.Storage.read_wad_hashes()
+    hashtables = hash_helper.Storage.hashtables
+    for wad_file in wad_files:
+        with pyRitoFile.wad.WAD.open(wad_file) as wad:
+            hexes = [pyRitoFile.wad.WADHasher.hash_to_hex(hash) for hash in wad.hashes]
+            raws = pyRitoFile.wad.WADHasher.hex_to_raw_batch(hashtables, hexes)
+            count = len(unknown)
+            for hash, hex, raw in zip(wad.hashes, hexes, raws):
+                if raw == hex:
+                    unknown.add(hash)
+                else:
+                    seeds.add(raw.lower())
+        print(f'hash_guesser: Finish: Read WAD: {wad_file}: {len(unknown) - count} unknown')
+    hash_helper.Storage.free_wad_hashes()
+    return unknown, seeds
+
+
+def make_tasks(seeds, dirs, new_dirs, names):
+    # yield tasks of a round, made while the pool consume them
+    # names: same as init_worker
+    seeds = sorted(seeds)
+    for i in range(0, len(seeds), TASK_SEEDS):
+        yield 'seeds', seeds[i:i+TASK_SEEDS]
+    # only pairs not tried in previous rounds
+    for task_dirs, kind in ((sorted(new_dirs), 'names'), (sorted(dirs), 'new_names')):
+        if len(task_dirs) == 0 or len(names[kind]) == 0:
+            continue
+        step = max(TASK_COMBINES // len(names[kind]), 1)
+        for i in range(0, len(task_dirs), step):
+            yield kind, task_dirs[i:i+step]
+
+
+def run_tasks(tasks, jobs, unknown, names, rules):
+    # yield guess_task results in task order
+    # at most jobs*2 tasks submitted ahead, tasks are not all made up front
+    if jobs <= 1:
+        init_worker(unknown, names, rules)
+        yield from map(guess_task, tasks)
+        return
+    with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(unknown, names, rules)) as executor:
+        running = deque()
+        for task in tasks:
+            if len(running) >= jobs * 2:
+                yield running.popleft().result()
+            running.append(executor.submit(guess_task, task))
+        while len(running) > 0:
+            yield running.popleft().result()
+
+
+def guess(*wad_files, rules=None, jobs=1, rounds=2):
+    # find paths of unknown chunk hashes in wad_files from the known paths
+    # of the same wads, hits of a round are the seeds of the next round
+    # found hashes are added to extracted hashes, return {hash: path}
+    rules = rules or GuessRules()
+    print(f'hash_guesser: Start:  Guess: {len(wad_files)} wads')
+    unknown, seeds = read_wads(wad_files)
+    hits = {}
+    dirs = set(prefix.rstrip('/') for prefix in rules.prefixes)
+    names = set()
+    for round_id in range(rounds):
+        if len(unknown) == 0 or len(seeds) == 0:
+            break
+        # without combine, known names are only tried in the prefixes
+        new_dirs, new_names = set(), set()
+        if rules.combine:
+            new_dirs = set(seed.rpartition('/')[0] for seed in seeds if '/' in seed) - dirs
+        if rules.combine or len(dirs) > 0:
+            new_names = set(seed.rpartition('/')[2] for seed in seeds) - names
+        # sent once per worker process with the pool initializer
+        round_names = {'names': sorted(names | new_names), 'new_names': sorted(new_names)}
+        tasks = make_tasks(seeds, dirs, new_dirs, round_names)
+        dirs |= new_dirs
+        names |= new_names
+        found = {}
+        total = 0
+        for count, task_hits in run_tasks(tasks, jobs, unknown, round_names, rules):
+            total += count
+            found.update(task_hits)
+        unknown.difference_update(found)
+        hits.update(found)
+        seeds = set(found.values())
+        print(f'hash_guesser: Finish: Round {round_id}: {total} candidates, {len(found)} found, {len(unknown)} unknown')
+    if len(hits) > 0:
+        hash_helper.ExtractedHashes.add_hashes({
+            'hashes.game.txt': {pyRitoFile.wad.WADHasher.hash_to_hex(hash): path for hash, path in hits.items()}
+        })
+    print(f'hash_guesser: Finish: Guess: {len(hits)} found')
+    return hits
+
+
+def guess_dir(path, rules=None, jobs=1, rounds=2):
+    # all wads under a folder, ex: Game/DATA/FINAL/Champions
+    if path.endswith('.wad.client'):
+        return guess(path, rules=rules, jobs=jobs, rounds=rounds)
+    return guess(*lepath.walk(path, lambda file: file.endswith('.wad.client')), rules=rules, jobs=jobs, rounds=rounds)
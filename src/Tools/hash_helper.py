@@ -2,9 +2,23 @@ try:
     import requests
 except: 
     print('Warning: hash_helper failed to import requests.')
-import os, os.path, json, traceback, threading
+import os, os.path, json, traceback, threading, heapq, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from operator import itemgetter
+from array import array
+from bisect import bisect_left
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+import sys
 from . import lepath, pyRitoFile
 
+# optional, HashTable.get_many fall back to one lookup per hex without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # 导入Core模块的路径和配置
 from Core.paths import get_cdtb_hashes_dir, get_extracted_hashes_dir, get_custom_hashes_dir
 from Core.config import cfg
@@ -15,6 +29,62 @@ def get_hash_separator(filename):
     return 16 if filename in WAD_HASHES else 8
 
 
+def read_sorted_hashes(file, sep, run_lines=250000):
+    # yield (key, value) of a hashes txt sorted by key, equal keys keep file order
+    # sorted in runs of run_lines, older runs spill to temp files and get merged back
+    spills = []
+    lines = []
+    try:
+        with open(file, 'r', encoding='utf-8') as f:
+            while True:
+                run = [line for line in islice(f, run_lines) if len(line) > sep]
+                if not run:
+                    break
+                if lines:
+                    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt', delete=False) as spill:
+                        spills.append(spill.name)
+                        spill.writelines(line if line.endswith('\n') else line + '\n' for line in lines)
+                run.sort(key=lambda line: line[:sep])
+                lines = run
+        runs = [open(spill, 'r', encoding='utf-8') for spill in spills]
+        try:
+            for line in heapq.merge(*runs, lines, key=lambda line: line[:sep]):
+                yield line[:sep], line[sep+1:].rstrip('\r\n')
+        finally:
+            for run in runs:
+                run.close()
+    finally:
+        for spill in spills:
+            os.remove(spill)
+
+
+def merge_sorted_hashes(*sources):
+    # k-way merge of key sorted (key, value) iterables, later sources win on equal keys
+    last = None
+    for item in heapq.merge(*sources, key=itemgetter(0)):
+        if last != None and last[0] != item[0]:
+            yield last
+        last = item
+    if last != None:
+        yield last
+
+
+def write_sorted_hashes(file, items):
+    # write aside then replace, the file can be one of the sources of items
+    tmp_file = file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.writelines(f'{key} {value}\n' for key, value in items)
+    os.replace(tmp_file, file)
+
+
+def combine_hashes(sources, output, sep):
+    # stream merge hashes txt files into output, sorted by key
+    write_sorted_hashes(output, merge_sorted_hashes(
+        *(read_sorted_hashes(source, sep) for source in sources if os.path.exists(source))
+    ))
+    return output
+
+
 def to_human(size): return str(size >> ((max(size.bit_length()-1, 0)//10)*10)) + \
     ["", " KB", " MB", " GB", " TB", " PB",
         " EB"][max(size.bit_length()-1, 0)//10]
@@ -28,6 +98,188 @@ class Bin_Hashes(dict):
             return super().__getitem__(key)
 
 
+class HashTable:
+    # read only hashtable over a compiled hashes file, mapped instead of parsed
+    # work like the dict of hex -> raw for lookups (in, [], get, items)
+    # get_many() resolve a list of hex at once with numpy
+    # file layout, little endian:
+    #   header: b'LTHT', u16 version, u16 key size (4: bin hashes, 8: wad hashes),
+    #           u32 count, u64 blob size, 4 pad bytes
+    #   blob: utf-8 strings
+    #   keys: count sorted u32/u64
+    #   starts, ends: count u32, string of key i is file[starts[i]:ends[i]]
+    #   buckets: BUCKETS + 1 u32, keys with top 16 bits b are keys[buckets[b]:buckets[b+1]]
+    # lookup is a binary search inside the bucket of the key
+    MAGIC = b'LTHT'
+    VERSION = 2
+    HEADER = Struct('<4sHHIQ4x')
+    BUCKETS = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap(f.fileno(), 0, access=ACCESS_READ)
+        magic, version, key_size, count, blob_size = HashTable.HEADER.unpack_from(self.data, 0)
+        if magic != HashTable.MAGIC or version != HashTable.VERSION:
+            self.data.close()
+            raise Exception(f'hash_helper: Error: Read HashTable {path}: Wrong file signature: {magic} {version}')
+        self.hex_size = key_size * 2
+        self.shift = key_size * 8 - 16
+        self.count = count
+        keys_start = HashTable.HEADER.size + blob_size
+        starts_start = keys_start + key_size * count
+        ends_start = starts_start + 4 * count
+        buckets_start = ends_start + 4 * count
+        self.buffer = memoryview(self.data)
+        self.keys = HashTable.view(self.buffer, keys_start, 'Q' if key_size == 8 else 'I', count)
+        self.starts = HashTable.view(self.buffer, starts_start, 'I', count)
+        self.ends = HashTable.view(self.buffer, ends_start, 'I', count)
+        self.buckets = HashTable.view(self.buffer, buckets_start, 'I', HashTable.BUCKETS + 1)
+        if numpy != None:
+            self.np_keys = numpy.frombuffer(self.data, dtype=f'<u{key_size}', count=count, offset=keys_start)
+            self.np_starts = numpy.frombuffer(self.data, dtype='<u4', count=count, offset=starts_start)
+            self.np_ends = numpy.frombuffer(self.data, dtype='<u4', count=count, offset=ends_start)
+
+    @staticmethod
+    def view(buffer, start, typecode, count):
+        # little endian array at start: zero copy cast, or a swapped copy on big endian
+        size = array(typecode).itemsize * count
+        if sys.byteorder == 'little':
+            return buffer[start:start+size].cast(typecode)
+        values = array(typecode)
+        values.frombytes(buffer[start:start+size])
+        values.byteswap()
+        return values
+
+    @staticmethod
+    def compile(txt_file, compiled_file, sep):
+        # sep: hex key length, see get_hash_separator
+        # the txt is streamed sorted by key (custom hashes already are),
+        # only the key/start/end columns are kept in memory
+        key_size = sep // 2
+        keys = array('Q' if key_size == 8 else 'I')
+        starts = array('I')
+        ends = array('I')
+        is_sorted = True
+        offset = HashTable.HEADER.size
+        tmp_file = compiled_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(bytes(offset))
+            for hex, raw in merge_sorted_hashes(read_sorted_hashes(txt_file, sep)):
+                try:
+                    key = int(hex, 16)
+                except ValueError:
+                    continue
+                if len(keys) > 0 and key <= keys[-1]:
+                    # ex: upper case hex, fixed below
+                    is_sorted = False
+                data = raw.encode('utf-8')
+                if offset + len(data) >= 1 << 32:
+                    raise Exception(f'hash_helper: Error: Compile HashTable {txt_file}: Strings too large: {offset + len(data)} bytes')
+                f.write(data)
+                keys.append(key)
+                starts.append(offset)
+                offset += len(data)
+                ends.append(offset)
+            if not is_sorted:
+                # sort by key, last one win on same key
+                order = sorted(range(len(keys)), key=lambda i: (keys[i], i))
+                order = [i for n, i in enumerate(order) if n + 1 == len(order) or keys[order[n+1]] != keys[i]]
+                keys = array(keys.typecode, (keys[i] for i in order))
+                starts = array('I', (starts[i] for i in order))
+                ends = array('I', (ends[i] for i in order))
+            # bucket b end where the first key of bucket b+1 start
+            shift = key_size * 8 - 16
+            buckets = array('I', bytes(4 * (HashTable.BUCKETS + 1)))
+            for key in keys:
+                buckets[(key >> shift) + 1] += 1
+            for bucket in range(HashTable.BUCKETS):
+                buckets[bucket + 1] += buckets[bucket]
+            for column in (keys, starts, ends, buckets):
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                f.write(column.tobytes())
+            f.seek(0)
+            f.write(HashTable.HEADER.pack(HashTable.MAGIC, HashTable.VERSION, key_size, len(keys), offset - HashTable.HEADER.size))
+        os.replace(tmp_file, compiled_file)
+
+    def close(self):
+        # numpy views must be gone before the map can close
+        self.np_keys = self.np_starts = self.np_ends = None
+        for column in (self.keys, self.starts, self.ends, self.buckets):
+            if isinstance(column, memoryview):
+                column.release()
+        self.buffer.release()
+        self.data.close()
+
+    def find(self, hex):
+        # index of hex key, or None
+        try:
+            if len(hex) != self.hex_size:
+                return None
+            key = int(hex, 16)
+        except (TypeError, ValueError):
+            return None
+        bucket = key >> self.shift
+        index = bisect_left(self.keys, key, self.buckets[bucket], self.buckets[bucket + 1])
+        if index != self.count and self.keys[index] == key:
+            return index
+        return None
+
+    def value(self, index):
+        return self.data[self.starts[index]:self.ends[index]].decode('utf-8')
+
+    def get(self, hex, default=None):
+        index = self.find(hex)
+        return default if index == None else self.value(index)
+
+    def get_many(self, hexes):
+        # {hex: raw} of the hexes found, one numpy search for all
+        hexes = [hex for hex in hexes if isinstance(hex, str) and len(hex) == self.hex_size]
+        if numpy == None or self.count == 0:
+            return {hex: raw for hex in hexes if (raw := self.get(hex)) != None}
+        key_size = self.hex_size // 2
+        try:
+            keys = bytes.fromhex(''.join(hexes))
+        except ValueError:
+            keys = b''
+        if len(keys) != key_size * len(hexes):
+            # some are not plain hex
+            return {hex: raw for hex in hexes if (raw := self.get(hex)) != None}
+        keys = numpy.frombuffer(keys, dtype=f'>u{key_size}').astype(self.np_keys.dtype)
+        indices = numpy.minimum(numpy.searchsorted(self.np_keys, keys), self.count - 1)
+        found = numpy.nonzero(self.np_keys[indices] == keys)[0]
+        indices = indices[found]
+        data = self.data
+        return {
+            hexes[i]: data[start:end].decode('utf-8')
+            for i, start, end in zip(found.tolist(), self.np_starts[indices].tolist(), self.np_ends[indices].tolist())
+        }
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, hex):
+        return self.find(hex) != None
+
+    def __getitem__(self, hex):
+        index = self.find(hex)
+        if index == None:
+            raise KeyError(hex)
+        return self.value(index)
+
+    def __iter__(self):
+        return self.keys_hex()
+
+    def keys_hex(self):
+        for key in self.keys:
+            yield f'{key:0{self.hex_size}x}'
+
+    def items(self):
+        for index, hex in enumerate(self.keys_hex()):
+            yield hex, self.value(index)
+
+
 BIN_HASHES = (
     'hashes.binentries.txt',
     'hashes.binhashes.txt',
@@ -40,8 +292,65 @@ WAD_HASHES = (
 )
 ALL_HASHES = BIN_HASHES + WAD_HASHES
 
+class HashTables:
+    # Storage.hashtables: table name -> hashtable
+    # a table is opened on its first lookup, then kept until freed
+    # read_*/free_* count references, so nested tools share opened tables
+    # and a table is only closed when the last user frees it
+    # only read (acquired) or set tables are in it, others are not opened
+    # compiled tables are read only, new hashes go through ExtractedHashes.add_hashes
+
+    def __init__(self, filenames):
+        self.refs = {filename: 0 for filename in filenames}
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, filename):
+        return filename in self.tables or self.refs.get(filename, 0) > 0
+
+    def __iter__(self):
+        return (filename for filename in self.refs if filename in self)
+
+    def __getitem__(self, filename):
+        table = self.tables.get(filename)
+        if table == None:
+            with self.lock:
+                table = self.tables.get(filename)
+                if table == None:
+                    if filename not in self:
+                        raise KeyError(filename)
+                    table = CustomHashes.load_hashes(filename)
+                    self.tables[filename] = table
+        return table
+
+    def __setitem__(self, filename, table):
+        with self.lock:
+            self.close(filename)
+            self.tables[filename] = table
+
+    def acquire(self, *filenames):
+        with self.lock:
+            for filename in filenames:
+                self.refs[filename] += 1
+
+    def release(self, *filenames):
+        with self.lock:
+            for filename in filenames:
+                self.refs[filename] = max(self.refs[filename] - 1, 0)
+                if self.refs[filename] == 0:
+                    self.close(filename)
+
+    def close(self, filename):
+        table = self.tables.pop(filename, None)
+        if isinstance(table, HashTable):
+            table.close()
+            # the txt can be newer than this table, only keep the compiled file of the current txt
+            local_file = CustomHashes.local_file(filename)
+            CustomHashes.remove_compiled_files(filename, keep=CustomHashes.compiled_file(filename) if os.path.exists(local_file) else None)
+
+
 class Storage:
-    hashtables = {key: {} for key in ALL_HASHES}
+    hashtables = HashTables(ALL_HASHES)
     bin_hashes = Bin_Hashes()
 
     def read_all_hashes(): CustomHashes.read_all_hashes()
@@ -107,8 +416,7 @@ class CDTBHashes:
             except Exception as e:
                 print(f'hash_helper: Error: Sync hash: {filename}: {e}')
                 print(traceback.format_exc())
-            CustomHashes.combine_custom_hashes(filename)
-            
+
         threads = [
             threading.Thread(
                 target = lambda f=filename: sync_hash(f),
@@ -120,6 +428,7 @@ class CDTBHashes:
             thread.start()
         for thread in threads:
             thread.join()
+        CustomHashes.combine_custom_hashes(*filenames)
         print(f'hash_helper: Finish: Sync all hashes.')
 
     @staticmethod
@@ -135,6 +444,142 @@ class CDTBHashes:
             json.dump(CDTBHashes.ETAG, f, indent=4, ensure_ascii=False)
 
 
+EXTRACT_HASHES = (
+    'hashes.binentries.txt',
+    'hashes.binhashes.txt',
+    'hashes.game.txt'
+)
+EXTRACT_GAME_PATHS = (
+    'assets/',
+    'clientstates/',
+    'data/',
+    'levels/',
+    'maps/',
+    'uiautoatlas/',
+    'ux/'
+)
+EXTRACT_TASK_SIZE = 64 * 1024**2
+EXTRACT_TASK_FILES = 64
+
+
+def extract_skn(hashtables, path, raw=False):
+    # extract submesh hash <-> submesh name
+    skn = pyRitoFile.skn.SKN().read(path, raw)
+    for submesh in skn.submeshes:
+        hashtables['hashes.binhashes.txt'][submesh.bin_hash] = submesh.name
+
+
+def extract_skl(hashtables, path, raw=False):
+    # extract joint hash <-> joint name
+    skl = pyRitoFile.skl.SKL().read(path, raw)
+    for joint in skl.joints:
+        hashtables['hashes.binhashes.txt'][joint.bin_hash] = joint.name
+
+
+def extract_bin(hashtables, path, raw=False):
+    # game paths are collected then hashed in one batch at the end
+    game_paths = []
+
+    def extract_file_value(value, value_type):
+        if value_type == pyRitoFile.bin.BINType.STRING:
+            value = value.lower()
+            if value.startswith(EXTRACT_GAME_PATHS):
+                game_paths.append(value)
+                if value.endswith('.dds'):
+                    temp = value.split('/')
+                    basename = temp[-1]
+                    dirname = '/'.join(temp[:-1])
+                    game_paths.append(f'{dirname}/2x_{basename}')
+                    game_paths.append(f'{dirname}/4x_{basename}')
+                elif value.endswith('.bin'):
+                    game_paths.append(lepath.ext(value, '.bin', '.py'))
+        elif value_type in (pyRitoFile.bin.BINType.LIST, pyRitoFile.bin.BINType.LIST2):
+            for v in value.data:
+                extract_file_value(v, value_type)
+        elif value_type in (pyRitoFile.bin.BINType.EMBED, pyRitoFile.bin.BINType.POINTER):
+            if value.data != None:
+                for f in value.data:
+                    extract_file_field(f)
+
+    def extract_file_field(field):
+        if field.type in (pyRitoFile.bin.BINType.LIST, pyRitoFile.bin.BINType.LIST2):
+            for v in field.data:
+                extract_file_value(v, field.value_type)
+        elif field.type in (pyRitoFile.bin.BINType.EMBED, pyRitoFile.bin.BINType.POINTER):
+            if field.data != None:
+                for f in field.data:
+                    extract_file_field(f)
+        elif field.type == pyRitoFile.bin.BINType.MAP:
+            for key, value in field.data.items():
+                extract_file_value(key, field.key_type)
+                extract_file_value(value, field.value_type)
+        elif field.type == pyRitoFile.bin.BINType.OPTION and field.value_type == pyRitoFile.bin.BINType.STRING:
+            if field.data != None:
+                extract_file_value(field.data, field.value_type)
+        else:
+            extract_file_value(field.data, field.type)
+
+    bin = pyRitoFile.bin.BIN().read(path, raw)
+    # extract VfxSystemDefinitionData <-> particlePath
+    VfxSystemDefinitionDatas = bin.get_items(lambda entry: entry.type == Storage.bin_hashes['VfxSystemDefinitionData'])
+    for VfxSystemDefinitionData in VfxSystemDefinitionDatas:
+        particlePaths = VfxSystemDefinitionData.get_items(lambda field: field.hash == Storage.bin_hashes['particlePath'])
+        if len(particlePaths) > 0:
+            hashtables['hashes.binentries.txt'][VfxSystemDefinitionData.hash] = particlePaths[0].data
+    # extract StaticMaterialDef <-> name
+    StaticMaterialDefs = bin.get_items(lambda entry: entry.type == Storage.bin_hashes['StaticMaterialDef'])
+    for StaticMaterialDef in StaticMaterialDefs:
+        names = StaticMaterialDef.get_items(lambda field: field.hash == Storage.bin_hashes['name'])
+        if len(names) > 0:
+            hashtables['hashes.binentries.txt'][StaticMaterialDef.hash] = names[0].data
+    # extract file hashes
+    for entry in bin.entries:
+        for field in entry.data:
+            extract_file_field(field)
+    for link in bin.links:
+        extract_file_value(link, pyRitoFile.bin.BINType.STRING)
+    hashtables['hashes.game.txt'].update(zip(pyRitoFile.wad.WADHasher.raw_to_hex_batch(game_paths), game_paths))
+
+
+EXTRACT_FUNCS = {
+    'skn': extract_skn,
+    'skl': extract_skl,
+    'bin': extract_bin,
+}
+
+
+def extract_task(task):
+    # worker: (wad path, start id, end id) or (file paths, None, None)
+    # -> ({table: {hash: name}}, error logs)
+    # errors are returned instead of printed so the parent keep the log in order
+    path, start, end = task
+    hashtables = {filename: {} for filename in EXTRACT_HASHES}
+    errors = []
+
+    def extract(extension, data, raw):
+        try:
+            EXTRACT_FUNCS[extension](hashtables, data, raw)
+        except Exception as e:
+            errors.append(f'hash_helper: Error: {e}')
+            errors.append(traceback.format_exc())
+
+    if isinstance(path, str):
+        with pyRitoFile.wad.WAD.open(path) as wad:
+            for id in range(start, end):
+                chunk = wad.chunk(id)
+                # only inflate the chunks we extract from
+                extension = chunk.probe_extension(wad.bs)
+                if extension not in EXTRACT_FUNCS:
+                    continue
+                chunk.read_data(wad.bs)
+                extract(extension, chunk.data, True)
+                chunk.free_data()
+    else:
+        for file_path in path:
+            extract(file_path.rsplit('.', 1)[-1], file_path, False)
+    return hashtables, errors
+
+
 class ExtractedHashes:
     # extracted hash
     local_dir = str(get_extracted_hashes_dir())
@@ -159,162 +604,76 @@ class ExtractedHashes:
         print('hash_helper: Finish: Clear Extract Hashes.')
     
     @staticmethod
-    def extract(*file_paths):
-        wad_hash = pyRitoFile.wad.WADHasher.raw_to_hex
-        start_game_path = [
-            'assets/', 
-            'clientstates/',
-            'data/',
-            'levels/',
-            'maps/',
-            'uiautoatlas/',
-            'ux/'
-        ]
+    def extract(*file_paths, jobs=1):
+        # wads are split into tasks of ~EXTRACT_TASK_SIZE compressed bytes,
+        # loose skn/skl/bin files into tasks of EXTRACT_TASK_FILES
+        # tasks run in worker processes, results merged here in task order
+        # tasks follow file_paths order, loose files are only batched with their neighbours
+        tasks = []
+        files = []
+        def add_files():
+            if len(files) > 0:
+                tasks.append((files[:], None, None))
+                files.clear()
 
-        hashtables = {
-            'hashes.binentries.txt': {},
-            'hashes.binhashes.txt': {},
-            'hashes.game.txt': {}
-        }
-        def extract_skn(path, raw=False):
-            try:
-                # extract submesh hash <-> submesh name
-                skn = pyRitoFile.skn.SKN().read(path, raw)
-                for submesh in skn.submeshes:
-                    hashtables['hashes.binhashes.txt'][submesh.bin_hash] = submesh.name
-                    print(f'hash_helper: Finish: Extract: {submesh.name}')
-            except Exception as e:
-                print(f'hash_helper: Error: {e}')
-                print(traceback.format_exc())
-                
-
-        def extract_skl(path, raw=False):
-            try:
-                # extract joint hash <-> joint name
-                skl = pyRitoFile.skl.SKL().read(path, raw)
-                for joint in skl.joints:
-                    hashtables['hashes.binhashes.txt'][joint.bin_hash] = joint.name
-                    print(f'hash_helper: Finish: Extract: {joint.name}')
-            except Exception as e:
-                print(f'hash_helper: Error: {e}')
-                print(traceback.format_exc())
-
-        def extract_bin(path, raw=False):
-            def extract_file_value(value, value_type):
-                if value_type == pyRitoFile.bin.BINType.STRING:
-                    value = value.lower()
-                    if any(value.startswith(prefix) for prefix in start_game_path):
-                        hashtables['hashes.game.txt'][wad_hash(
-                            value)] = value
-                        print(f'hash_helper: Finish: Extract: {value}')
-                        if value.endswith('.dds'):
-                            temp = value.split('/')
-                            basename = temp[-1]
-                            dirname = '/'.join(temp[:-1])
-                            value2x = f'{dirname}/2x_{basename}'
-                            value4x = f'{dirname}/4x_{basename}'
-                            hashtables['hashes.game.txt'][wad_hash(
-                                value2x)] = value2x
-                            hashtables['hashes.game.txt'][wad_hash(
-                                value4x)] = value4x
-                        elif value.endswith('.bin'):
-                            valuepy = lepath.ext(value, '.bin', '.py')
-                            hashtables['hashes.game.txt'][wad_hash(valuepy)] = valuepy
-                elif value_type in (pyRitoFile.bin.BINType.LIST, pyRitoFile.bin.BINType.LIST2):
-                    for v in value.data:
-                        extract_file_value(v, value_type)
-                elif value_type in (pyRitoFile.bin.BINType.EMBED, pyRitoFile.bin.BINType.POINTER):
-                    if value.data != None:
-                        for f in value.data:
-                            extract_file_field(f)
-
-            def extract_file_field(field):
-                if field.type in (pyRitoFile.bin.BINType.LIST, pyRitoFile.bin.BINType.LIST2):
-                    for v in field.data:
-                        extract_file_value(v, field.value_type)
-                elif field.type in (pyRitoFile.bin.BINType.EMBED, pyRitoFile.bin.BINType.POINTER):
-                    if field.data != None:
-                        for f in field.data:
-                            extract_file_field(f)
-                elif field.type == pyRitoFile.bin.BINType.MAP:
-                    for key, value in field.data.items():
-                        extract_file_value(key, field.key_type)
-                        extract_file_value(value, field.value_type)
-                elif field.type == pyRitoFile.bin.BINType.OPTION and field.value_type == pyRitoFile.bin.BINType.STRING:
-                    if field.data != None:
-                        extract_file_value(field.data, field.value_type)
-                else:
-                    extract_file_value(field.data, field.type)
-
-            try:
-                bin = pyRitoFile.bin.BIN().read(path, raw)
-                # extract VfxSystemDefinitionData <-> particlePath
-                VfxSystemDefinitionDatas = bin.get_items(lambda entry: entry.type == Storage.bin_hashes['VfxSystemDefinitionData'])
-                for VfxSystemDefinitionData in VfxSystemDefinitionDatas:
-                    particlePaths = VfxSystemDefinitionData.get_items(lambda field: field.hash == Storage.bin_hashes['particlePath'])
-                    if len(particlePaths) > 0:
-                        hashtables['hashes.binentries.txt'][VfxSystemDefinitionData.hash] = particlePaths[0].data
-                        print(f'hash_helper: Finish: Extract: {particlePaths[0].data}')
-                # extract StaticMaterialDef <-> name
-                StaticMaterialDefs = bin.get_items(lambda entry: entry.type == Storage.bin_hashes['StaticMaterialDef'])
-                for StaticMaterialDef in StaticMaterialDefs:
-                    names = StaticMaterialDef.get_items(lambda field: field.hash == Storage.bin_hashes['name'])
-                    if len(names) > 0:
-                        hashtables['hashes.binentries.txt'][StaticMaterialDef.hash] = names[0].data
-                        print(f'hash_helper: Finish: Extract: {names[0].data}')
-                # extract file hashes
-                for entry in bin.entries:
-                    for field in entry.data:
-                        extract_file_field(field)
-                for link in bin.links:
-                    extract_file_value(link, pyRitoFile.bin.BINType.STRING)
-            except Exception as e:
-                print(f'hash_helper: Error: {e}')
-                print(traceback.format_exc())
-                
-        def extract_wad(path):
-            wad = pyRitoFile.wad.WAD().read(path)
-            with pyRitoFile.stream.BytesStream.reader(path) as bs:
-                for chunk in wad.chunks:
-                    chunk.read_data(bs)
-                    if chunk.extension == 'skn':
-                        extract_skn(chunk.data, raw=True)
-                    elif chunk.extension == 'skl':
-                        extract_skl(chunk.data, raw=True)
-                    elif chunk.extension == 'bin':
-                        extract_bin(chunk.data, raw=True)
-                    chunk.free_data()
-            
-
-        # extract hashes base on file types
         for file_path in file_paths:
             if file_path.endswith('.wad.client'):
-                extract_wad(file_path)
-            elif file_path.endswith('.skn'):
-                extract_skn(file_path)
-            elif file_path.endswith('.skl'):
-                extract_skl(file_path)
-            elif file_path.endswith('.bin'):
-                extract_bin(file_path)
-        # write out hashes txt
+                add_files()
+                with pyRitoFile.wad.WAD.open(file_path) as wad:
+                    start, size = 0, 0
+                    for id, compressed_size in enumerate(wad.compressed_sizes):
+                        size += compressed_size
+                        if size >= EXTRACT_TASK_SIZE:
+                            tasks.append((file_path, start, id + 1))
+                            start, size = id + 1, 0
+                    if start < len(wad):
+                        tasks.append((file_path, start, len(wad)))
+            elif file_path.endswith(('.skn', '.skl', '.bin')):
+                files.append(file_path)
+                if len(files) == EXTRACT_TASK_FILES:
+                    add_files()
+        add_files()
+
+        hashtables = {filename: {} for filename in EXTRACT_HASHES}
+        def log(label, count):
+            if label != None:
+                print(f'hash_helper: Finish: Extract: {label}: {count} hashes')
+
+        def merge(results):
+            # one log line per wad / files task
+            label, count = None, 0
+            for (path, _, _), (extracted, errors) in zip(tasks, results):
+                task_label = path if isinstance(path, str) else f'{len(path)} files'
+                if task_label != label:
+                    log(label, count)
+                    label, count = task_label, 0
+                for filename, hashes in extracted.items():
+                    hashtables[filename].update(hashes)
+                    count += len(hashes)
+                for error in errors:
+                    print(error)
+            log(label, count)
+
+        if jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(min(jobs, len(tasks))) as executor:
+                merge(executor.map(extract_task, tasks))
+        else:
+            merge(map(extract_task, tasks))
+        ExtractedHashes.add_hashes(hashtables)
+
+    @staticmethod
+    def add_hashes(hashtables):
+        # hashtables: {table: {hex: raw}}, merged into extracted hashes txt
+        # then into custom hashes
         for filename, hashtable in hashtables.items():
             local_file = ExtractedHashes.local_file(filename)
-            sep = get_hash_separator(filename)
-            # read existed extracted hashes
+            sources = [sorted(hashtable.items())]
+            # merge with existed extracted hashes
             if os.path.exists(local_file):
-                with open(local_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        hashtable[line[:sep]] = line[sep+1:-1]
-            # write
-            with open(local_file, 'w+', encoding='utf-8') as f:
-                f.writelines(
-                    f'{key} {value}\n'
-                    for key, value in sorted(
-                        hashtable.items(), key=lambda item: item[1]
-                    )
-                )
+                sources.append(read_sorted_hashes(local_file, get_hash_separator(filename)))
+            write_sorted_hashes(local_file, merge_sorted_hashes(*sources))
             print(f'hash_helper: Finish: Extract: {local_file}')
-            CustomHashes.combine_custom_hashes(filename)
+        CustomHashes.combine_custom_hashes(*hashtables)
 
 
 class CustomHashes:
@@ -324,6 +683,23 @@ class CustomHashes:
 
     def local_file(filename): 
         return f'{CustomHashes.local_dir}/{filename}'
+
+    def compiled_file(filename):
+        # versioned by layout and txt mtime: a newer txt compile to a new file,
+        # the old one can still be mapped (windows can't replace mapped files)
+        local_file = CustomHashes.local_file(filename)
+        return f'{CustomHashes.local_dir}/{filename}.{HashTable.VERSION}.{os.stat(local_file).st_mtime_ns}.lht'
+
+    def remove_compiled_files(filename, keep=None):
+        # remove old compiled versions of filename, except keep
+        # the ones still mapped somewhere fail on windows, removed next time
+        for name in os.listdir(CustomHashes.local_dir):
+            path = f'{CustomHashes.local_dir}/{name}'
+            if name.startswith(f'{filename}.') and name.endswith('.lht') and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
     
     def calculate_size():
         total_size = 0
@@ -333,29 +709,23 @@ class CustomHashes:
         return to_human(total_size)
 
     @staticmethod
-    def read_hashes(*filenames):
-        for filename in filenames:
-            local_file = CustomHashes.local_file(filename)
-            # safe check
-            if os.path.exists(local_file):
-                # read hashes
-                with open(local_file, 'r', encoding='utf-8') as f:
-                    sep = get_hash_separator(filename)
-                    for line in f:
-                        Storage.hashtables[filename][line[:sep]] = line[sep+1:-1]
+    def load_hashes(filename):
+        # map compiled hashes, compile once per txt version
+        local_file = CustomHashes.local_file(filename)
+        # safe check
+        if not os.path.exists(local_file):
+            return {}
+        compiled_file = CustomHashes.compiled_file(filename)
+        if not os.path.exists(compiled_file):
+            HashTable.compile(local_file, compiled_file, get_hash_separator(filename))
+        table = HashTable(compiled_file)
+        CustomHashes.remove_compiled_files(filename, keep=compiled_file)
+        return table
 
     @staticmethod
-    def write_hashes(*filenames):
-        for filename in filenames:
-            local_file = CustomHashes.local_file(filename)
-            # write combined hashes
-            with open(local_file, 'w+', encoding='utf-8') as f:
-                f.writelines(
-                    f'{key} {value}\n'
-                    for key, value in sorted(
-                        Storage.hashtables[filename].items(), key=lambda item: item[1]
-                    )
-                )
+    def read_hashes(*filenames):
+        # tables are opened on first lookup, see HashTables
+        Storage.hashtables.acquire(*filenames)
 
     @staticmethod
     def read_bin_hashes():
@@ -371,8 +741,7 @@ class CustomHashes:
 
     @staticmethod
     def free_hashes(*filenames):
-        for filename in filenames:
-            Storage.hashtables[filename] = {}
+        Storage.hashtables.release(*filenames)
 
     @staticmethod
     def free_bin_hashes(*filenames):
@@ -388,35 +757,22 @@ class CustomHashes:
 
     @staticmethod
     def combine_custom_hashes(*filenames):
-        for filename in filenames:
-            hashtable = {}
-            cdtb_file = CDTBHashes.local_file(filename)
-            ex_file = ExtractedHashes.local_file(filename)
-            ch_file = CustomHashes.local_file(filename)
-            sep = get_hash_separator(filename)
-            # read cdtb hashes
-            if os.path.exists(cdtb_file):
-                with open(cdtb_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        hashtable[line[:sep]] = line[sep+1:-1]
-            # read extracted hashes
-            if os.path.exists(ex_file):
-                with open(ex_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        hashtable[line[:sep]] = line[sep+1:-1]
-            # read existed custom hashes
-            if os.path.exists(ch_file):
-                with open(ch_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        hashtable[line[:sep]] = line[sep+1:-1]
-            # write combined hashes
-            with open(ch_file, 'w+', encoding='utf-8') as f:
-                f.writelines(
-                    f'{key} {value}\n'
-                    for key, value in sorted(
-                        hashtable.items(), key=lambda item: item[1]
-                    )
-                )
+        # cdtb < extracted < existed custom hashes, merged on disk
+        # one process per table
+        tasks = [
+            (
+                (CDTBHashes.local_file(filename), ExtractedHashes.local_file(filename), CustomHashes.local_file(filename)),
+                CustomHashes.local_file(filename),
+                get_hash_separator(filename)
+            )
+            for filename in filenames
+        ]
+        if len(tasks) == 1:
+            ch_files = [combine_hashes(*tasks[0])]
+        else:
+            with ProcessPoolExecutor(min(len(tasks), os.cpu_count() or 1)) as executor:
+                ch_files = executor.map(combine_hashes, *zip(*tasks))
+        for ch_file in ch_files:
             print(f'hash_helper: Finish: Combine: {ch_file}')
 
     @staticmethod
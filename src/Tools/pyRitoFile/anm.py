@@ -511,10 +511,7 @@ class ANM:
             for translate_index, rotate_index, scale_index in frames:
                 bs.write_u16(translate_index, rotate_index, scale_index)
             # write offsets
-            bs.seek(12) 
-            bs.write_u32(bs.end()) # file_size
-            bs.seek(40)
-            bs.write_u32(joint_hashes_offset-12)
-            bs.seek(52)
-            bs.write_u32(vecs_offset-12, quat_offsets-12, frames_offset-12)
+            bs.patch_u32(12, bs.end()) # file_size
+            bs.patch_u32(40, joint_hashes_offset-12)
+            bs.patch_u32(52, vecs_offset-12, quat_offsets-12, frames_offset-12)
             return bs.raw() if raw else None
\ No newline at end of file
@@ -1,7 +1,8 @@
 from .stream import BytesStream
-from .helper import FNV1a
+from .helper import FNV1a, HASH_MEMO_SIZE
 from .wad import WADHasher
 from enum import Enum
+from functools import lru_cache
 
 class BINType(Enum):
     # basic
@@ -58,8 +59,10 @@ class BINHasher:
     @staticmethod
     def hex_to_raw(hashtables, hex):
         for table_name in reversed(BINHasher.HASHTABLE_NAMES):
-            if table_name in hashtables and hex in hashtables[table_name]:
-                return hashtables[table_name][hex]
+            if table_name in hashtables:
+                raw = hashtables[table_name].get(hex)
+                if raw != None:
+                    return raw
         return hex
     
     @staticmethod
@@ -79,13 +82,16 @@ class BINHasher:
         except:
             return False
 
+    # same memo as WADHasher.raw_or_hex_to_hash,
+    # it calls the unmemoized FNV1a so a name is only cached here
     @staticmethod
+    @lru_cache(maxsize=HASH_MEMO_SIZE)
     def raw_or_hex_to_hash(raw_or_hex):
-        if len(raw_or_hex) != 8: return FNV1a(raw_or_hex)
+        if len(raw_or_hex) != 8: return FNV1a.__wrapped__(raw_or_hex)
         try:
             return int(raw_or_hex, 16)
         except:
-            return FNV1a(raw_or_hex)
+            return FNV1a.__wrapped__(raw_or_hex)
         
     @staticmethod
     def un_hash_value(hashtables, value, value_type):
@@ -292,7 +298,7 @@ class BINWriter:
         for value in field.data:
             content_size += BINWriter.write_value(bs,
                                                     value, field.value_type, header_size=False)
-        bs.size_offsets.append((return_offset, content_size))
+        bs.patch_u32(return_offset, content_size)
 
         size += content_size
         return None, size
@@ -316,7 +322,7 @@ class BINWriter:
             for value in field.data:
                 content_size += BINWriter.write_field(
                     bs, value, header_size=True)
-            bs.size_offsets.append((return_offset, content_size))
+            bs.patch_u32(return_offset, content_size)
 
             size += content_size
         return None, size
@@ -351,7 +357,7 @@ class BINWriter:
                                                     key, field.key_type, header_size=False)
             content_size += BINWriter.write_value(bs,
                                                     value, field.value_type, header_size=False)
-        bs.size_offsets.append((return_offset, content_size))
+        bs.patch_u32(return_offset, content_size)
 
         size += content_size
         return None, size
@@ -541,7 +547,6 @@ class BIN:
             bs.write_u32(len(self.entries))
             for entry in self.entries:
                 bs.write_u32(BINHasher.raw_or_hex_to_hash(entry.type))
-            bs.size_offsets = []  # this help to write sizes
             for entry in self.entries:
                 return_offset = bs.tell()
 
@@ -553,7 +558,7 @@ class BIN:
                 for field in entry.data:
                     entry_size += BINWriter.write_field(
                         bs, field, header_size=True)
-                bs.size_offsets.append((return_offset, entry_size))
+                bs.patch_u32(return_offset, entry_size)
             # patches
             if self.is_patch:
                 bs.write_u32(len(self.patches))
@@ -568,12 +573,7 @@ class BIN:
                     bs.write_s_sized16(patch.path, encoding='utf-8')
                     patch_size += BINWriter.write_value(
                         bs, patch.data, patch.type, header_size=False)
-                    bs.size_offsets.append(
-                        (return_offset, patch_size))
-            # jump around and write size
-            for offset, size in bs.size_offsets:
-                bs.seek(offset)
-                bs.write_u32(size)
+                    bs.patch_u32(return_offset, patch_size)
             return bs.raw() if raw else None
 
     def un_hash(self, hashtables=None):
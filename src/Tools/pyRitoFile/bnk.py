@@ -369,10 +369,7 @@ class BNK:
             # wem data - need to minus start offset
             start_offset = bs.tell()
             for i, wem_data in enumerate(wem_datas):
-                data_offset = bs.tell()
-                bs.seek(wem_data_offsets[i])
-                bs.write_u32(data_offset-start_offset)
-                bs.seek(data_offset)
+                bs.patch_u32(wem_data_offsets[i], bs.tell()-start_offset)
                 bs.write(wem_data)
                 
             return bs.raw() if raw else None
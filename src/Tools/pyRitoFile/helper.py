@@ -1,4 +1,26 @@
+from functools import lru_cache
 
+# optional, batch hashing fall back to the per string functions without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# not safe because external modules
+try:
+    from xxhash import xxh64_intdigest
+except:
+    print('Warning: pyRitoFile.helper failed to import xxhash.')
+
+# names repeat a lot (field names, joint names, entry types)
+HASH_MEMO_SIZE = 1 << 16
+# below this, numpy setup cost more than the python loop
+BATCH_MIN = 64
+# strings per numpy block, keep the padded matrix small
+BATCH_BLOCK = 1 << 16
+
+
+@lru_cache(maxsize=HASH_MEMO_SIZE)
 def Elf(s):
     h = 0
     for c in s.lower():
@@ -10,15 +32,79 @@ def Elf(s):
     return h
 
 
+@lru_cache(maxsize=HASH_MEMO_SIZE)
 def FNV1(s):
     h = 0x811c9dc5
     for b in s.encode('ascii').lower():
-        h = ((h * 0x01000193) % 0x100000000) ^ b
+        h = ((h * 0x01000193) & 0xFFFFFFFF) ^ b
     return h
 
 
+@lru_cache(maxsize=HASH_MEMO_SIZE)
 def FNV1a(s):
     h = 0x811c9dc5
     for b in s.encode('ascii').lower():
-        h = ((h ^ b) * 0x01000193) % 0x100000000
+        h = ((h ^ b) * 0x01000193) & 0xFFFFFFFF
     return h
+
+
+def pack_strings(strings):
+    # lowered ascii strings -> rows of a zero padded uint8 matrix, longest first
+    # return (order, active, matrix): row i is strings[order[i]],
+    # active[j] = number of rows longer than j, so column j only touch matrix[:active[j]]
+    encoded = [s.encode('ascii').lower() for s in strings]
+    lengths = numpy.fromiter(map(len, encoded), dtype=numpy.int64, count=len(encoded))
+    order = numpy.argsort(-lengths, kind='stable')
+    lengths = lengths[order]
+    width = int(lengths[0]) if len(lengths) > 0 else 0
+    matrix = numpy.zeros((len(encoded), width), dtype=numpy.uint64)
+    matrix[numpy.arange(width) < lengths[:, None]] = numpy.frombuffer(
+        b''.join(encoded[i] for i in order), dtype=numpy.uint8)
+    active = len(encoded) - numpy.cumsum(numpy.bincount(lengths, minlength=width))[:width]
+    return order, active.tolist(), matrix
+
+
+def hash_batch(strings, func, step, init):
+    # hash a list of strings column by column with numpy
+    # func: per string fallback, step(h, column) -> h on uint64 arrays
+    if numpy == None or len(strings) < BATCH_MIN:
+        return [func(s) for s in strings]
+    result = []
+    for block_start in range(0, len(strings), BATCH_BLOCK):
+        block = strings[block_start:block_start+BATCH_BLOCK]
+        try:
+            order, active, matrix = pack_strings(block)
+        except UnicodeEncodeError:
+            # same error (or result for Elf) as the per string functions
+            result.extend(func(s) for s in block)
+            continue
+        h = numpy.full(len(block), init, dtype=numpy.uint64)
+        for j, count in enumerate(active):
+            h[:count] = step(h[:count], matrix[:count, j])
+        block_result = numpy.empty_like(h)
+        block_result[order] = h
+        result.extend(block_result.tolist())
+    return result
+
+
+def Elf_step(h, c):
+    h = (h << numpy.uint64(4)) + c
+    t = h & numpy.uint64(0xF0000000)
+    return (h ^ (t >> numpy.uint64(24))) & ~t
+
+
+def FNV1a_step(h, b):
+    return ((h ^ b) * numpy.uint64(0x01000193)) & numpy.uint64(0xFFFFFFFF)
+
+
+def Elf_batch(strings):
+    return hash_batch(strings, Elf, Elf_step, 0)
+
+
+def FNV1a_batch(strings):
+    return hash_batch(strings, FNV1a, FNV1a_step, 0x811c9dc5)
+
+
+def XXH64_batch(strings):
+    # xxhash is already compiled, one call per string is the fast path
+    return [xxh64_intdigest(s.lower()) for s in strings]
@@ -1,12 +1,18 @@
 from .stream import BytesStream
 from ..pyRitoFile.structs import Matrix4
-from .helper import Elf, FNV1a
+from .helper import Elf_batch, FNV1a, FNV1a_batch
 
 
 def bin_hash(name):
     return f'{FNV1a(name):08x}'
 
 
+def set_bin_hashes(joints):
+    # all joint names hashed at once
+    for joint, hash in zip(joints, FNV1a_batch([joint.name for joint in joints])):
+        joint.bin_hash = f'{hash:08x}'
+
+
 class SKLJoint:
     __slots__ = (
         'id', 'name', 'bin_hash', 'parent', 'hash', 'radius', 'flags',
@@ -100,8 +106,8 @@ class SKL:
                         return_offset = bs.tell()
                         bs.seek(return_offset-4 + joint_name_offset)
                         joint.name, = bs.read_c_until0()
-                        joint.bin_hash = bin_hash(joint.name)
                         bs.seek(return_offset)
+                    set_bin_hashes(self.joints)
 
                 # read influences
                 if influences_offset > 0 and influence_count > 0:
@@ -131,9 +137,7 @@ class SKL:
                 old_matrices = [None] * joint_count
                 for joint_id, joint in enumerate(self.joints):
                     joint.name, = bs.read_s_padded(32)
-                    joint.bin_hash = bin_hash(joint.name)
                     joint.id = joint_id
-                    joint.hash = Elf(joint.name)
                     joint.parent, = bs.read_i32()
                     joint.radius, = bs.read_f32()
                     floats = [0.0]*16
@@ -142,6 +146,9 @@ class SKL:
                             floats[r*4+c], = bs.read_f32()
                     floats[15] = 1.0
                     old_matrices[joint_id] = Matrix4(*floats)
+                set_bin_hashes(self.joints)
+                for joint, hash in zip(self.joints, Elf_batch([joint.name for joint in self.joints])):
+                    joint.hash = hash
 
                 # old matrix to local translation, ibind rotation
                 for joint_id, joint in enumerate(self.joints):
@@ -227,6 +234,5 @@ class SKL:
                 bs.write_u32(joint.hash)
 
             # file size
-            bs.seek(0)
-            bs.write_u32(bs.end())
+            bs.patch_u32(0, bs.end())
             return bs.raw() if raw else None
@@ -1,7 +1,49 @@
 from io import BytesIO, StringIO
 from struct import Struct
+from mmap import mmap, ACCESS_READ
+from array import array
+from sys import byteorder
 from .structs import Vector, Quaternion, Matrix4
 
+# optional, typed array reads fall back to array.array without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# compiled structs, keyed by (type, count)
+# building a Struct every call cost more than the unpack itself
+STRUCTS = {}
+
+def get_struct(fmt, count=1):
+    try:
+        return STRUCTS[fmt, count]
+    except KeyError:
+        s = STRUCTS[fmt, count] = Struct(f'<{count}{fmt}')
+        return s
+
+def get_struct_fmt(fmt):
+    # raw format string from read_fmt/write_fmt, used as is
+    try:
+        return STRUCTS[fmt]
+    except KeyError:
+        s = STRUCTS[fmt] = Struct(fmt)
+        return s
+
+# struct type -> little endian numpy dtype, the types read_array accept
+NUMPY_DTYPES = {
+    'b': '<i1',
+    'B': '<u1',
+    'h': '<i2',
+    'H': '<u2',
+    'i': '<i4',
+    'I': '<u4',
+    'q': '<i8',
+    'Q': '<u8',
+    'f': '<f4',
+    'd': '<f8',
+}
+
 class StringStream:
     @staticmethod
     def reader(path, raw=False):
@@ -18,11 +60,14 @@ class StringStream:
 class BytesStream:
     @staticmethod
     def reader(path, raw=False):
-        return BytesStream(BytesIO(path)) if raw else BytesStream(open(path, 'rb'))
+        return BufferStream(path) if raw else BufferStream.map(path)
         
     @staticmethod
-    def writer(path, raw=False):
-        return BytesStream(BytesIO()) if raw else BytesStream(open(path, 'wb'))
+    def writer(path, raw=False, in_memory=True):
+        # in_memory=False: write straight to the file, for outputs too big to buffer
+        if not raw and not in_memory:
+            return BytesStream(open(path, 'wb'))
+        return BufferWriter(None if raw else path)
         
     @staticmethod
     def updater(path, raw=False):
@@ -30,6 +75,7 @@ class BytesStream:
         
     def __init__(self, f):
         self.stream = f
+        self.patches = []
 
     def __enter__(self):
         return self
@@ -55,180 +101,392 @@ class BytesStream:
         return e
 
     def close(self):
+        self.apply_patches()
         self.stream.close()
 
     def raw(self):
+        self.apply_patches()
         self.seek(0)
         return self.stream.read()
 
+    # patch: values that are only known later (sizes, offsets)
+    # are recorded instead of seeking back right away
+    # and all written in one pass, sorted by offset, on close/raw
+
+    def patch(self, offset, data):
+        self.patches.append((offset, data))
+
+    def patch_fmt(self, offset, fmt, *values):
+        self.patch(offset, get_struct_fmt(fmt).pack(*values))
+
+    def patch_u32(self, offset, *values):
+        self.patch(offset, get_struct('I', len(values)).pack(*values))
+
+    def apply_patches(self):
+        if len(self.patches) == 0:
+            return
+        return_offset = self.tell()
+        # stable sort, later patch at same offset still win
+        for offset, data in sorted(self.patches, key=lambda patch: patch[0]):
+            self.seek(offset)
+            self.write(data)
+        self.patches = []
+        self.seek(return_offset)
+
     # read
 
+    def unpack(self, fmt, count):
+        s = get_struct(fmt, count)
+        return s.unpack(self.stream.read(s.size))
+
     def read_fmt(self, fmt, fmt_size):
-        return Struct(fmt).unpack(self.stream.read(fmt_size))
+        return get_struct_fmt(fmt).unpack(self.stream.read(fmt_size))
 
     def read(self, length):
         return self.stream.read(length)
 
+    def read_view(self, length=-1):
+        return self.stream.read(length)
+
     def read_b(self, count=1):
-        return Struct(f'<{count}?').unpack(self.stream.read(count))
+        return self.unpack('?', count)
 
     def read_i8(self, count=1):
-        return Struct(f'<{count}b').unpack(self.stream.read(count))
+        return self.unpack('b', count)
 
     def read_u8(self, count=1):
-        return Struct(f'<{count}B').unpack(self.stream.read(count))
+        return self.unpack('B', count)
 
     def read_i16(self, count=1):
-        return Struct(f'<{count}h').unpack(self.stream.read(count*2))
+        return self.unpack('h', count)
 
     def read_u16(self, count=1):
-        return Struct(f'<{count}H').unpack(self.stream.read(count*2))
+        return self.unpack('H', count)
 
     def read_i32(self, count=1):
-        return Struct(f'<{count}i').unpack(self.stream.read(count*4))
+        return self.unpack('i', count)
 
     def read_u32(self, count=1):
-        return Struct(f'<{count}I').unpack(self.stream.read(count*4))
+        return self.unpack('I', count)
 
     def read_i64(self, count=1):
-        return Struct(f'<{count}q').unpack(self.stream.read(count*8))
+        return self.unpack('q', count)
 
     def read_u64(self, count=1):
-        return Struct(f'<{count}Q').unpack(self.stream.read(count*8))
+        return self.unpack('Q', count)
 
     def read_f32(self, count=1):
-        return Struct(f'<{count}f').unpack(self.stream.read(count*4))
+        return self.unpack('f', count)
 
     def read_f64(self, count=1):
-        return Struct(f'<{count}d').unpack(self.stream.read(count*8))
+        return self.unpack('d', count)
 
     def read_vec2(self, count=1):
-        floats = Struct(f'<{count*2}f').unpack(self.stream.read(count*8))
+        floats = self.unpack('f', count*2)
         return [Vector(floats[i], floats[i+1]) for i in range(0, len(floats), 2)]
 
     def read_vec3(self, count=1):
-        floats = Struct(f'<{count*3}f').unpack(self.stream.read(count*12))
+        floats = self.unpack('f', count*3)
         return [Vector(floats[i], floats[i+1], floats[i+2]) for i in range(0, len(floats), 3)]
 
     def read_vec4(self, count=1):
-        floats = Struct(f'<{count*4}f').unpack(self.stream.read(count*16))
+        floats = self.unpack('f', count*4)
         return [Vector(floats[i], floats[i+1], floats[i+2], floats[i+3]) for i in range(0, len(floats), 4)]
 
     def read_quat(self, count=1):
-        floats = Struct(f'<{count*4}f').unpack(self.stream.read(count*16))
+        floats = self.unpack('f', count*4)
         return [Quaternion(floats[i], floats[i+1], floats[i+2], floats[i+3]) for i in range(0, len(floats), 4)]
 
+    # typed arrays: one copy from the buffer, no per element object
+    # always flat, count*width values: vec i is values[i*width:(i+1)*width]
+    # numpy array if numpy is available (.reshape(count, width) is free), else array.array
+
+    def read_array(self, fmt, count, width=1):
+        if fmt not in NUMPY_DTYPES:
+            raise Exception(
+                f'pyRitoFile: Error: Read array: Unsupported type: {fmt}')
+        length = get_struct(fmt, count*width).size
+        data = self.read_view(length)
+        if len(data) != length:
+            raise Exception(
+                f'pyRitoFile: Error: Read array: Expected {length} bytes, got {len(data)} bytes.')
+        if numpy != None:
+            return numpy.frombuffer(bytearray(data), dtype=NUMPY_DTYPES[fmt])
+        values = array(fmt)
+        values.frombytes(data)
+        if byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def read_u8_array(self, count):
+        return self.read_array('B', count)
+
+    def read_u16_array(self, count):
+        return self.read_array('H', count)
+
+    def read_u32_array(self, count):
+        return self.read_array('I', count)
+
+    def read_f32_array(self, count):
+        return self.read_array('f', count)
+
+    def read_vec2_array(self, count):
+        return self.read_array('f', count, 2)
+
+    def read_vec3_array(self, count):
+        return self.read_array('f', count, 3)
+
+    def read_vec4_array(self, count):
+        return self.read_array('f', count, 4)
+
     def read_mtx4(self):
-        return Matrix4(*Struct('16f').unpack(self.stream.read(64))),
+        return Matrix4(*self.read_fmt('16f', 64)),
         
     def read_s(self, length, encoding='ascii'):
-        return self.stream.read(length).decode(encoding),
+        return self.read(length).decode(encoding),
 
     def read_s_padded(self, length, encoding='ascii'):
-        return bytes(b for b in self.stream.read(length) if b != 0).decode(encoding),
+        return bytes(b for b in self.read(length) if b != 0).decode(encoding),
 
     def read_s_sized16(self, encoding='ascii'):
-        return self.stream.read(Struct('H').unpack(self.stream.read(2))[0]).decode(encoding),
+        return self.read(self.read_fmt('H', 2)[0]).decode(encoding),
 
     def read_s_sized32(self, encoding='ascii'):
-        return self.stream.read(Struct('I').unpack(self.stream.read(4))[0]).decode(encoding),
+        return self.read(self.read_fmt('I', 4)[0]).decode(encoding),
 
     def read_c_until0(self):
-        s = ''
+        # read by blocks and find the terminator instead of byte by byte
+        blocks = []
         while True:
-            c = self.stream.read(1)[0]
-            if c == 0:
+            block = self.stream.read(256)
+            if len(block) == 0:
+                raise Exception(
+                    'pyRitoFile: Error: Read string: Missing null terminator.')
+            end = block.find(b'\x00')
+            if end != -1:
+                blocks.append(block[:end])
+                # go back to right after the terminator
+                self.stream.seek(end + 1 - len(block), 1)
                 break
-            s += chr(c)
-        return s,
+            blocks.append(block)
+        return b''.join(blocks).decode('latin-1'),
 
     def read_c_sep_0(self, length):
-        s = ''
-        for i in range(length):
-            s += chr(self.stream.read(1)[0])
-            self.pad(1)
-        return s,
+        # every char is followed by a 0 byte
+        return self.read(length*2)[::2].decode('latin-1'),
 
     # write
 
+    def pack(self, fmt, values):
+        self.write(get_struct(fmt, len(values)).pack(*values))
+
     def write_fmt(self, fmt, *values):
-        self.stream.write(Struct(fmt).pack(*values))
+        self.write(get_struct_fmt(fmt).pack(*values))
 
     def write(self, values):
         self.stream.write(values)
 
     def write_b(self, *values):
-        self.stream.write(Struct(f'<{len(values)}?').pack(*values))
+        self.pack('?', values)
 
     def write_i8(self, *values):
-        self.stream.write(Struct(f'<{len(values)}b').pack(*values))
+        self.pack('b', values)
 
     def write_u8(self, *values):
-        self.stream.write(Struct(f'<{len(values)}B').pack(*values))
+        self.pack('B', values)
 
     def write_i16(self, *values):
-        self.stream.write(Struct(f'<{len(values)}h').pack(*values))
+        self.pack('h', values)
 
     def write_u16(self, *values):
-        self.stream.write(Struct(f'<{len(values)}H').pack(*values))
+        self.pack('H', values)
 
     def write_i32(self, *values):
-        self.stream.write(Struct(f'<{len(values)}i').pack(*values))
+        self.pack('i', values)
 
     def write_u32(self, *values):
-        self.stream.write(Struct(f'<{len(values)}I').pack(*values))
+        self.pack('I', values)
 
     def write_i64(self, *values):
-        self.stream.write(Struct(f'<{len(values)}q').pack(*values))
+        self.pack('q', values)
 
     def write_u64(self, *values):
-        self.stream.write(Struct(f'<{len(values)}Q').pack(*values))
+        self.pack('Q', values)
 
     def write_f32(self, *values):
-        self.stream.write(Struct(f'<{len(values)}f').pack(*values))
+        self.pack('f', values)
 
     def write_vec2(self, *values):
         floats = [f for vec in values for f in vec]
-        self.stream.write(Struct(f'<{len(floats)}f').pack(*floats))
+        self.pack('f', floats)
 
     def write_vec3(self, *values):
         floats = [f for vec in values for f in vec]
-        self.stream.write(Struct(f'<{len(floats)}f').pack(*floats))
+        self.pack('f', floats)
 
     def write_vec4(self, *values):
         floats = [f for vec in values for f in vec]
-        self.stream.write(Struct(f'<{len(floats)}f').pack(*floats))
+        self.pack('f', floats)
 
     def write_quat(self, *values):
         floats = [f for quat in values for f in quat]
-        self.stream.write(Struct(f'<{len(floats)}f').pack(*floats))
+        self.pack('f', floats)
 
     def write_mtx4(self, mtx4):
         floats = [f for f in mtx4]
-        self.stream.write(Struct('16f').pack(*floats))
+        self.write(get_struct_fmt('16f').pack(*floats))
     
     def write_s(self, value, encoding='ascii'):
-        self.stream.write(value.encode(encoding))
+        self.write(value.encode(encoding))
 
     def write_s_padded(self, value, length, encoding='ascii'):
         if len(value) > length:
             value = value[:length]
         v = value.encode(encoding)
-        self.stream.write(v + b'\x00'*(length-len(v)))
+        self.write(v + b'\x00'*(length-len(v)))
 
     def write_s_sized16(self, value, encoding='ascii'):
         v = value.encode(encoding)
-        self.stream.write(Struct('H').pack(len(v)))
-        self.stream.write(v)
+        self.write(get_struct_fmt('H').pack(len(v)))
+        self.write(v)
 
     def write_s_sized32(self, value, encoding='ascii'):
         v = value.encode(encoding)
-        self.stream.write(Struct('I').pack(len(v)))
-        self.stream.write(v)
+        self.write(get_struct_fmt('I').pack(len(v)))
+        self.write(v)
 
     def write_c_sep_0(self, value):
-        s = b''
-        for c in value.encode('ascii'):
-            s += bytes([c])
-            s += b'\x00'
-        self.stream.write(s)
+        v = value.encode('ascii')
+        s = bytearray(len(v)*2)
+        s[::2] = v
+        self.write(s)
+
+
+class BufferStream(BytesStream):
+    # read only stream over a mmap (file) or memoryview (raw bytes)
+    # track offset itself and unpack straight from the buffer
+    # so nothing is copied through a file read first
+    @staticmethod
+    def map(path):
+        with open(path, 'rb') as f:
+            try:
+                return BufferStream(mmap(f.fileno(), 0, access=ACCESS_READ))
+            except ValueError:
+                # empty file can not be mapped
+                return BufferStream(f.read())
+
+    def __init__(self, data):
+        self.data = data
+        self.buffer = memoryview(data)
+        if self.buffer.format != 'B' or self.buffer.ndim != 1:
+            self.buffer = self.buffer.cast('B')
+        self.offset = 0
+
+    def find(self, sub, start):
+        # bytes/bytearray/mmap search in place
+        # memoryview has no find(), search it block by block without copying it whole
+        if hasattr(self.data, 'find'):
+            return self.data.find(sub, start)
+        size = len(self.buffer)
+        block_size = 256
+        while start < size:
+            stop = min(start + block_size, size)
+            index = bytes(self.buffer[start:stop]).find(sub)
+            if index != -1:
+                return start + index
+            if stop == size:
+                break
+            # sub may cross the block end
+            start = max(stop - len(sub) + 1, start + 1)
+            block_size = min(block_size * 2, 65536)
+        return -1
+
+    # stream
+    def tell(self):
+        return self.offset
+
+    def seek(self, pos, mode=0):
+        if mode == 1:
+            pos += self.offset
+        elif mode == 2:
+            pos += len(self.buffer)
+        self.offset = pos
+
+    def pad(self, length):
+        self.offset += length
+
+    def end(self):
+        return len(self.buffer)
+
+    def close(self):
+        self.buffer.release()
+        if isinstance(self.data, mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                # someone still hold a view from read_view
+                # mmap will be closed when it is garbage collected
+                pass
+
+    def raw(self):
+        self.offset = len(self.buffer)
+        return bytes(self.buffer)
+
+    # read
+
+    def unpack(self, fmt, count):
+        s = get_struct(fmt, count)
+        values = s.unpack_from(self.buffer, self.offset)
+        self.offset += s.size
+        return values
+
+    def read_fmt(self, fmt, fmt_size):
+        values = get_struct_fmt(fmt).unpack_from(self.buffer, self.offset)
+        self.offset += fmt_size
+        return values
+
+    def read(self, length=-1):
+        return bytes(self.read_view(length))
+
+    def read_c_until0(self):
+        end = self.find(b'\x00', self.offset)
+        if end == -1:
+            raise Exception(
+                'pyRitoFile: Error: Read string: Missing null terminator.')
+        s = str(self.buffer[self.offset:end], 'latin-1')
+        self.offset = end + 1
+        return s,
+
+    def read_c_sep_0(self, length):
+        # every char is followed by a 0 byte, only the chars are copied
+        return self.read_view(length*2)[::2].tobytes().decode('latin-1'),
+
+    def read_view(self, length=-1):
+        # zero copy slice of the buffer
+        # only valid until the stream is closed, copy it if need to keep
+        start = self.offset
+        stop = len(self.buffer) if length == None or length < 0 else min(start + length, len(self.buffer))
+        self.offset = max(stop, start)
+        return self.buffer[start:stop]
+
+
+class BufferWriter(BytesStream):
+    # write into memory, seek/patch only move around the buffer
+    # the file (if any) is written once, on close
+    def __init__(self, path=None):
+        super().__init__(BytesIO())
+        self.path = path
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # dont write a half built file on error
+        if exc_type != None:
+            self.path = None
+        self.close()
+
+    def close(self):
+        self.apply_patches()
+        if self.path != None:
+            with open(self.path, 'wb') as f, self.stream.getbuffer() as view:
+                f.write(view)
+            self.path = None
+        self.stream.close()
@@ -1,14 +1,25 @@
 from .stream import BytesStream
+from .helper import XXH64_batch, HASH_MEMO_SIZE
 from enum import Enum
-import gzip
+from array import array
+from struct import iter_unpack
+from bisect import bisect_left
+from functools import lru_cache
+import gzip, zlib, os, io
 
 # not safe because external modules
 try: 
     import pyzstd
-    from xxhash import xxh64, xxh3_64
+    from xxhash import xxh64, xxh3_64, xxh3_128
 except:
     print('Warning: pyRitoFile.wad failed to import pyzstd, xxhash.')
 
+# optional, toc columns are plain array.array without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class WADExtensioner:
     signature_to_extension = {
         b'OggS': 'ogg',
@@ -54,20 +65,33 @@ class WADExtensioner:
 
     @staticmethod
     def guess_extension(data):
-        if data[4:8] == bytes.fromhex('C3 4F FD 22'):
+        if data[4:8] == WADExtensioner.skl_signature:
             return 'skl'
-        else:
-            for signature, extension in WADExtensioner.signature_to_extension.items():
-                if data.startswith(signature):
-                    return extension
+        if len(data) == 0:
+            return None
+        # only signatures starting with the same byte, in the order above
+        for signature, extension in WADExtensioner.first_byte_to_signatures.get(data[0], ()):
+            if data.startswith(signature):
+                return extension
 
     @staticmethod
     def get_extension(path):
         if path.endswith('.wad.client'):
             return 'wad'
-        for _, extension in WADExtensioner.signature_to_extension.items():
-            if path.endswith(extension):
-                return extension
+        # exact extension match: two parts ones first (min.js), then the last part
+        names = path.rsplit('.', 2)
+        if len(names) == 3 and f'{names[1]}.{names[2]}' in WADExtensioner.extensions:
+            return f'{names[1]}.{names[2]}'
+        if len(names) >= 2 and names[-1] in WADExtensioner.extensions:
+            return names[-1]
+
+
+# lookup tables for WADExtensioner, built once from signature_to_extension
+WADExtensioner.skl_signature = bytes.fromhex('C3 4F FD 22')
+WADExtensioner.first_byte_to_signatures = {}
+for signature, extension in WADExtensioner.signature_to_extension.items():
+    WADExtensioner.first_byte_to_signatures.setdefault(signature[0], []).append((signature, extension))
+WADExtensioner.extensions = frozenset(WADExtensioner.signature_to_extension.values())
             
 
 class WADHasher:
@@ -78,14 +102,35 @@ class WADHasher:
     @staticmethod
     def hex_to_raw(hashtables, hex):
         for table_name in reversed(WADHasher.HASHTABLE_NAMES):
-            if table_name in hashtables and hex in hashtables[table_name]:
-                return hashtables[table_name][hex]
+            if table_name in hashtables:
+                raw = hashtables[table_name].get(hex)
+                if raw != None:
+                    return raw
         return hex
+
+    @staticmethod
+    def hex_to_raw_batch(hashtables, hexes):
+        # same as hex_to_raw on every hex, one search per table
+        raws = {}
+        missing = list(hexes)
+        for table_name in reversed(WADHasher.HASHTABLE_NAMES):
+            if len(missing) == 0:
+                break
+            if table_name in hashtables:
+                table = hashtables[table_name]
+                found = table.get_many(missing) if hasattr(table, 'get_many') else {hex: table[hex] for hex in missing if hex in table}
+                raws.update(found)
+                missing = [hex for hex in missing if hex not in found]
+        return [raws.get(hex, hex) for hex in hexes]
     
     @staticmethod
     def raw_to_hex(raw):
         return f'{xxh64(raw.lower()).intdigest():016x}'
 
+    @staticmethod
+    def raw_to_hex_batch(raws):
+        return [f'{hash:016x}' for hash in XXH64_batch(raws)]
+
     @staticmethod
     def hash_to_hex(hash):
         return f'{hash:016x}'
@@ -99,7 +144,10 @@ class WADHasher:
         except:
             return False
 
+    # memo shared by every read/write in the process
+    # hits/misses: WADHasher.raw_or_hex_to_hash.cache_info()
     @staticmethod
+    @lru_cache(maxsize=HASH_MEMO_SIZE)
     def raw_or_hex_to_hash(raw_or_hex):
         if len(raw_or_hex) != 16: return xxh64(raw_or_hex.lower()).intdigest()
         try:
@@ -124,10 +172,10 @@ class WADChunk:
         'id', 'hash', 'offset',
         'compressed_size', 'decompressed_size', 'compression_type',
         'duplicated', 'subchunk_start', 'subchunk_count',
-        'checksum', 'data', 'extension'
+        'checksum', 'data', 'extension', 'subchunks'
     )
 
-    def __init__(self, id=None, hash=None, offset=None, compressed_size=None, decompressed_size=None, compression_type=None, duplicated=None, subchunk_start=None, subchunk_count=None, checksum=None, data=None, extension=None):
+    def __init__(self, id=None, hash=None, offset=None, compressed_size=None, decompressed_size=None, compression_type=None, duplicated=None, subchunk_start=None, subchunk_count=None, checksum=None, data=None, extension=None, subchunks=None):
         self.id = id
         self.hash = hash
         self.offset = offset
@@ -140,9 +188,12 @@ class WADChunk:
         self.checksum = checksum
         self.data = data
         self.extension = extension
+        # ZstdChunked only: (compressed size, decompressed size, checksum)
+        # of each subchunk, from the wad .subchunktoc
+        self.subchunks = subchunks
 
     def __json__(self):
-        return {key: getattr(self, key) for key in self.__slots__ if key != 'data'}
+        return {key: getattr(self, key) for key in self.__slots__ if key not in ('data', 'subchunks')}
 
     @staticmethod
     def default(*, id=0, hash='', offset=0, compressed_size=0, decompressed_size=0, compression_type=WADCompressionType.Raw, duplicated=False, subchunk_start=0, subchunk_count=0, checksum=0):
@@ -162,12 +213,33 @@ class WADChunk:
     def free_data(self):
         self.data = None
 
-    def read_data(self, bs):
+    def read_data(self, bs, executor=None):
         # read data and decompress
         bs.seek(self.offset)
-        raw = bs.read(self.compressed_size)
+        self.decompress_data(bs.read_view(self.compressed_size), executor)
+
+    @staticmethod
+    def decompress_subchunk(raw, compressed_size, decompressed_size):
+        # subchunks that dont shrink are stored raw
+        if compressed_size == decompressed_size:
+            return bytes(raw)
+        return pyzstd.decompress(raw)
+
+    def iter_subchunks(self, raw):
+        # yield (compressed bytes, compressed size, decompressed size, decompressed offset)
+        raw_offset = 0
+        data_offset = 0
+        for compressed_size, decompressed_size, _ in self.subchunks:
+            yield raw[raw_offset:raw_offset+compressed_size], compressed_size, decompressed_size, data_offset
+            raw_offset += compressed_size
+            data_offset += decompressed_size
+
+    def decompress_data(self, raw, executor=None):
+        # raw: compressed bytes of this chunk
+        # executor: optional pool to decompress subchunks of a ZstdChunked chunk in parallel
+        # no stream access, safe to call from worker threads
         if self.compression_type == WADCompressionType.Raw:
-            self.data = raw
+            self.data = bytes(raw)
         elif self.compression_type == WADCompressionType.Gzip:
             self.data = gzip.decompress(raw)
         elif self.compression_type == WADCompressionType.Satellite:
@@ -176,65 +248,153 @@ class WADChunk:
         elif self.compression_type == WADCompressionType.Zstd:
             self.data = pyzstd.decompress(raw)
         elif self.compression_type == WADCompressionType.ZstdChunked:
-            if raw[:4] == b'\x28\xb5\x2f\xfd':
+            if self.subchunks:
+                jobs = [subchunk[:3] for subchunk in self.iter_subchunks(raw)]
+                if executor != None:
+                    self.data = b''.join(executor.map(lambda job: WADChunk.decompress_subchunk(*job), jobs))
+                else:
+                    self.data = b''.join(WADChunk.decompress_subchunk(*job) for job in jobs)
+            elif raw[:4] == b'\x28\xb5\x2f\xfd':
                 self.data = pyzstd.decompress(raw)
             else:
-                self.data = raw
+                self.data = bytes(raw)
         # guess extension
         if self.extension == None:
             self.extension = WADExtensioner.guess_extension(self.data)
 
-    def write_data(self, bs, chunk_id, chunk_hash, chunk_data, *, previous_chunks=None):
+    @staticmethod
+    def decompress_head(decompressor, raw, end):
+        # feed compressed bytes a piece at a time, stop once end bytes are out
+        datas = []
+        size = 0
+        for i in range(0, len(raw), 4096):
+            data = decompressor.decompress(bytes(raw[i:i+4096]))
+            datas.append(data)
+            size += len(data)
+            if size >= end:
+                break
+        return b''.join(datas)[:end]
+
+    def read_range(self, bs, start, size=-1):
+        # decompressed bytes [start, start+size) without inflating the whole chunk
+        # ZstdChunked: only subchunks overlapping the range are decompressed
+        # Zstd, Gzip: stream decompress stop at the end of range
+        end = self.decompressed_size if size < 0 else min(start + size, self.decompressed_size)
+        if start >= end:
+            return b''
+        bs.seek(self.offset)
+        raw = bs.read_view(self.compressed_size)
+        zstd_magic = raw[:4] == b'\x28\xb5\x2f\xfd'
+        if self.compression_type == WADCompressionType.ZstdChunked and self.subchunks:
+            datas = []
+            for subchunk_raw, compressed_size, decompressed_size, data_offset in self.iter_subchunks(raw):
+                if data_offset >= end:
+                    break
+                if data_offset + decompressed_size > start:
+                    if compressed_size == decompressed_size:
+                        data = subchunk_raw[max(start - data_offset, 0):end - data_offset]
+                    else:
+                        data = WADChunk.decompress_head(pyzstd.EndlessZstdDecompressor(), subchunk_raw, end - data_offset)
+                        data = data[max(start - data_offset, 0):]
+                    datas.append(data)
+            return b''.join(datas)
+        elif self.compression_type == WADCompressionType.Zstd or (self.compression_type == WADCompressionType.ZstdChunked and zstd_magic):
+            return WADChunk.decompress_head(pyzstd.EndlessZstdDecompressor(), raw, end)[start:]
+        elif self.compression_type == WADCompressionType.Gzip:
+            return WADChunk.decompress_head(zlib.decompressobj(31), raw, end)[start:]
+        elif self.compression_type == WADCompressionType.Satellite:
+            # Satellite is not supported
+            return None
+        else:
+            return bytes(raw[start:end])
+
+    def probe_extension(self, bs, size=64):
+        # guess extension from the first bytes only, without inflating the whole chunk
+        if self.extension == None:
+            data = self.read_range(bs, 0, size)
+            if data:
+                self.extension = WADExtensioner.guess_extension(data)
+        return self.extension
+
+    def write_data(self, bs, chunk_id, chunk_hash, chunk_data, *, previous_chunks=None, duplicates=None, level=None):
         self.hash = chunk_hash
+        self.compress_data(chunk_data, level)
+        self.store_data(bs, chunk_id, previous_chunks=previous_chunks, duplicates=duplicates)
+
+    def compress_data(self, chunk_data, level=None):
+        # no stream access, safe to call from worker threads
+        # level: zstd compression level, None = zstd default
         if self.extension in ('bnk', 'wpk'):
             self.data = chunk_data
             self.compression_type = WADCompressionType.Raw
         else:
-            self.data = pyzstd.compress(chunk_data)
+            self.data = pyzstd.compress(chunk_data, level)
             self.compression_type = WADCompressionType.Zstd
         self.compressed_size = len(self.data)
         self.decompressed_size = len(chunk_data)
         self.checksum = xxh3_64(self.data).intdigest()
+
+    @staticmethod
+    def raw_data_key(chunk_data):
+        # key of uncompressed data, to find identical files before compressing
+        return (len(chunk_data), xxh3_128(chunk_data).digest())
+
+    def copy_data_info(self, chunk):
+        # take compressed infos of a chunk with identical data
+        # without compressing again, used with store_data to dedup
+        self.compression_type = chunk.compression_type
+        self.compressed_size = chunk.compressed_size
+        self.decompressed_size = chunk.decompressed_size
+        self.checksum = chunk.checksum
+
+    def store_data(self, bs, chunk_id, *, previous_chunks=None, duplicates=None):
+        # append compressed data (unless duplicated) and patch toc entry
+        # duplicates: dict of (checksum, compressed size, decompressed size) -> chunk
+        # filled by this function, lookup in O(1) instead of scanning previous_chunks
+        self.duplicated = False
+        duped_chunk = None
+        data_key = (self.checksum, self.compressed_size, self.decompressed_size)
         # check duplicated data
-        if previous_chunks:
-            duped_id, duped_chunk = None, None
-            for id, chunk in enumerate(previous_chunks):
+        if duplicates != None:
+            duped_chunk = duplicates.get(data_key)
+        elif previous_chunks:
+            for chunk in previous_chunks:
                 if chunk.checksum == self.checksum and chunk.compressed_size == self.compressed_size and chunk.decompressed_size == self.decompressed_size:
-                    duped_id = id
                     duped_chunk = chunk
                     break
-            if duped_chunk != None:
-                # if there is a duped chunk in previous
-                if not duped_chunk.duplicated:
-                    # if the chunk was not a duped chunk
-                    # rewrite the duplicated value for the previous chunk
-                    duped_chunk.duplicated = True
-                    bs.seek(272 + duped_id * 32 + 21)
-                    bs.write_b(duped_chunk.duplicated)
-                # set this chunk as duplicated and copy the offset from duped chunk
-                self.duplicated = True
-                self.offset = duped_chunk.offset
+        if duped_chunk != None:
+            # if there is a duped chunk in previous
+            if not duped_chunk.duplicated:
+                # if the chunk was not a duped chunk
+                # rewrite the duplicated value for the previous chunk
+                duped_chunk.duplicated = True
+                bs.patch_fmt(272 + duped_chunk.id * 32 + 21, '<?', duped_chunk.duplicated)
+            # set this chunk as duplicated and copy the offset from duped chunk
+            self.duplicated = True
+            self.offset = duped_chunk.offset
         if not self.duplicated:
             # if its duplicated dont need to write data
             # go to end file, save data offset and write chunk data
             bs.seek(0, 2)
             self.offset = bs.tell()
             bs.write(self.data)
-        # go to this chunk offset and write stuffs
+            if duplicates != None:
+                duplicates[data_key] = self
+        # patch this chunk toc entry, written with the others on close
         # hack: the first chunk start at 272 (because we write version 3.3)
         self.id = chunk_id
         chunk_offset = 272 + chunk_id * 32
-        bs.seek(chunk_offset)
-        bs.write_u64(WADHasher.raw_or_hex_to_hash(chunk_hash))
-        bs.write_u32(
+        bs.patch_fmt(
+            chunk_offset, '<QIIIB?HQ',
+            WADHasher.raw_or_hex_to_hash(self.hash),
             self.offset,
             self.compressed_size,
-            self.decompressed_size
+            self.decompressed_size,
+            self.compression_type.value,
+            self.duplicated,
+            0,
+            self.checksum
         )
-        bs.write_u8(self.compression_type.value)
-        bs.write_b(self.duplicated)
-        bs.write_u16(0)
-        bs.write_u64(self.checksum)
 
 
 class WAD:
@@ -248,54 +408,98 @@ class WAD:
     def __json__(self):
         return {key: getattr(self, key) for key in self.__slots__ if key != 'IO'}
 
+    def read_header(self, bs, path):
+        # read header, stop right before chunk count
+        self.signature, = bs.read_s(2)
+        if self.signature != 'RW':
+            raise Exception(
+                f'pyRitoFile: Error: Read WAD {path}: Wrong file signature: {self.signature}')
+        major, minor = bs.read_u8(2)
+        self.version = float(f'{major}.{minor}')
+        if major > 3:
+            raise Exception(
+                f'pyRitoFile: Error: Read WAD {path}: Unsupported file version: {self.version}')
+        wad_checksum = 0
+        if major == 2:
+            ecdsa_len = bs.read_u8()
+            bs.pad(83)
+            wad_checksum, = bs.read_u64()
+        elif major == 3:
+            bs.pad(256)
+            wad_checksum, = bs.read_u64()
+        if major == 1 or major == 2:
+            toc_start_offset, toc_file_entry_size = bs.read_u16(
+                2)
+        return major
+
     def read(self, path, raw=False):
         with BytesStream.reader(path, raw) as bs:
-            # read header
-            self.signature, = bs.read_s(2)
-            if self.signature != 'RW':
-                raise Exception(
-                    f'pyRitoFile: Error: Read WAD {path}: Wrong file signature: {self.signature}')
-            major, minor = bs.read_u8(2)
-            self.version = float(f'{major}.{minor}')
-            if major > 3:
-                raise Exception(
-                    f'pyRitoFile: Error: Read WAD {path}: Unsupported file version: {self.version}')
-            wad_checksum = 0
-            if major == 2:
-                ecdsa_len = bs.read_u8()
-                bs.pad(83)
-                wad_checksum, = bs.read_u64()
-            elif major == 3:
-                bs.pad(256)
-                wad_checksum, = bs.read_u64()
-            if major == 1 or major == 2:
-                toc_start_offset, toc_file_entry_size = bs.read_u16(
-                    2)
+            major = self.read_header(bs, path)
             # read chunks
             chunk_count, = bs.read_u32()
-            self.chunks = [WADChunk() for i in range(chunk_count)]
-            for chunk_id, chunk in enumerate(self.chunks):
-                chunk.id = chunk_id
-                chunk.hash = WADHasher.hash_to_hex(bs.read_u64()[0])
-                chunk.offset, chunk.compressed_size, chunk.decompressed_size, = bs.read_u32(
-                    3)
-                chunk.compression_type = WADCompressionType(
-                    bs.read_u8()[0] & 15)
-                chunk.duplicated, = bs.read_b()
-                chunk.subchunk_start, = bs.read_u16()
-                chunk.subchunk_count = chunk.compression_type.value >> 4
-                chunk.checksum = bs.read_u64()[0] if major >= 2 else 0
-            
+            # unpack the whole toc at once, 24 bytes entries for v1 (no checksum), 32 for v2/3
+            toc = bs.read_view(chunk_count * (32 if major >= 2 else 24))
+            compression_types = {type.value: type for type in WADCompressionType}
+            self.chunks = [
+                WADChunk(
+                    id=chunk_id,
+                    hash=f'{entry[0]:016x}',
+                    offset=entry[1],
+                    compressed_size=entry[2],
+                    decompressed_size=entry[3],
+                    compression_type=compression_types[entry[4] & 15],
+                    duplicated=entry[5] != 0,
+                    subchunk_start=entry[6],
+                    subchunk_count=entry[4] >> 4,
+                    checksum=entry[7] if major >= 2 else 0
+                )
+                for chunk_id, entry in enumerate(iter_unpack(MappedWAD.TOC_FORMATS[major], toc))
+            ]
+            # attach subchunk infos to ZstdChunked chunks
+            chunked = [chunk for chunk in self.chunks if chunk.compression_type == WADCompressionType.ZstdChunked]
+            if len(chunked) > 0 and not raw:
+                index = {int(chunk.hash, 16): chunk for chunk in self.chunks}
+                for toc_hash in WAD.subchunk_toc_hashes(path):
+                    if toc_hash in index:
+                        toc_chunk = index[toc_hash]
+                        toc_chunk.read_data(bs)
+                        subchunks = WAD.read_subchunk_toc(toc_chunk.data)
+                        toc_chunk.free_data()
+                        for chunk in chunked:
+                            chunk.subchunks = subchunks[chunk.subchunk_start:chunk.subchunk_start+chunk.subchunk_count]
+                        break
             return self
 
+    @staticmethod
+    def subchunk_toc_hashes(path):
+        # the .subchunktoc chunk is hashed from the wad path relative to game folder
+        # (data/final/.../name.wad.subchunktoc), which is not known here
+        # so try every tail of the path
+        names = path.lower().replace('\\', '/').split('/')
+        if names[-1].endswith('.client'):
+            names[-1] = names[-1][:-7]
+        return [xxh64('/'.join(names[i:]) + '.subchunktoc').intdigest() for i in range(len(names))]
+
+    @staticmethod
+    def read_subchunk_toc(data):
+        # 16 bytes per subchunk: compressed size, decompressed size, checksum
+        return list(iter_unpack('<IIQ', data))
+
+    @staticmethod
+    def open(path, raw=False):
+        return MappedWAD(path, raw)
+
+    def write_header(self, bs):
+        bs.write_s('RW')  # signature
+        bs.write_u8(3, 3)  # version
+        bs.write(b'\x00' * 256)  # pad 256 bytes
+        bs.write_u64(0)  # wad checksum
+        bs.write_u32(len(self.chunks))
+
     def write(self, path, raw=False):
         with BytesStream.writer(path, raw) as bs:
             # write header
-            bs.write_s('RW')  # signature
-            bs.write_u8(3, 3)  # version
-            bs.write(b'\x00' * 256)  # pad 256 bytes
-            bs.write_u64(0)  # wad checksum
-            bs.write_u32(len(self.chunks))
+            self.write_header(bs)
             # write chunks
             for chunk in self.chunks:
                 bs.write_u64(WADHasher.raw_or_hex_to_hash(chunk.hash))
@@ -313,8 +517,8 @@ class WAD:
     def un_hash(self, hashtables=None):
         if hashtables == None:
             return
-        for chunk in self.chunks:
-            chunk.hash = WADHasher.hex_to_raw(hashtables, chunk.hash)
+        for chunk, raw in zip(self.chunks, WADHasher.hex_to_raw_batch(hashtables, [chunk.hash for chunk in self.chunks])):
+            chunk.hash = raw
             if '.' in chunk.hash and chunk.extension == None:
                 chunk.extension = WADExtensioner.get_extension(chunk.hash)
         self.chunks = sorted(self.chunks, key=lambda chunk: chunk.hash)
@@ -325,3 +529,557 @@ class WAD:
             if compare_func(item):
                 res.append(item)
         return res
+
+
+class MappedWAD:
+    # lazy wad: the file stay mapped and the toc is kept as packed columns
+    # chunk objects are only created for the entries someone asks for
+    # lookup by path hash is a dict hit instead of a scan over chunks
+    TOC_FORMATS = {
+        1: '<QIIIBBH',
+        2: '<QIIIBBHQ',
+        3: '<QIIIBBHQ',
+    }
+    TOC_FIELDS = (
+        ('hashes', 'Q', '<u8'),
+        ('offsets', 'I', '<u4'),
+        ('compressed_sizes', 'I', '<u4'),
+        ('decompressed_sizes', 'I', '<u4'),
+        ('types', 'B', 'u1'),
+        ('duplicateds', 'B', 'u1'),
+        ('subchunk_starts', 'H', '<u2'),
+        ('checksums', 'Q', '<u8'),
+    )
+
+    def __init__(self, path, raw=False):
+        self.path = path
+        self.raw = raw
+        self.bs = BytesStream.reader(path, raw)
+        header = WAD()
+        major = header.read_header(self.bs, path)
+        self.signature = header.signature
+        self.version = header.version
+        chunk_count, = self.bs.read_u32()
+        toc_format = MappedWAD.TOC_FORMATS[major]
+        fields = MappedWAD.TOC_FIELDS if major >= 2 else MappedWAD.TOC_FIELDS[:-1]
+        toc = self.bs.read_view(chunk_count * (32 if major >= 2 else 24))
+        # toc columns
+        if numpy != None:
+            entries = numpy.frombuffer(toc, dtype=[(name, dtype) for name, _, dtype in fields])
+            for name, typecode, dtype in fields:
+                setattr(self, name, array(typecode, entries[name].tobytes()))
+        else:
+            columns = list(zip(*iter_unpack(toc_format, toc))) if chunk_count > 0 else [()] * len(fields)
+            for (name, typecode, _), column in zip(fields, columns):
+                setattr(self, name, array(typecode, column))
+        if major < 2:
+            self.checksums = array('Q', bytes(8 * chunk_count))
+        # path hash -> chunk id
+        self.index = {hash: id for id, hash in enumerate(self.hashes)}
+        self.cache = {}
+        # loaded on first ZstdChunked chunk
+        self.subchunk_toc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __iter__(self):
+        for id in range(len(self.hashes)):
+            yield self.chunk(id)
+
+    def __contains__(self, key):
+        return self.find(key) != None
+
+    def close(self):
+        self.bs.close()
+
+    def find(self, key):
+        # key: int hash, hex string or raw path
+        if not isinstance(key, int):
+            key = WADHasher.raw_or_hex_to_hash(key)
+        return self.index.get(key)
+
+    def chunk(self, id):
+        chunk = self.cache.get(id)
+        if chunk == None:
+            chunk_type = self.types[id]
+            chunk = self.cache[id] = WADChunk(
+                id=id,
+                hash=WADHasher.hash_to_hex(self.hashes[id]),
+                offset=self.offsets[id],
+                compressed_size=self.compressed_sizes[id],
+                decompressed_size=self.decompressed_sizes[id],
+                compression_type=WADCompressionType(chunk_type & 15),
+                duplicated=self.duplicateds[id] != 0,
+                subchunk_start=self.subchunk_starts[id],
+                subchunk_count=chunk_type >> 4,
+                checksum=self.checksums[id]
+            )
+            if chunk.compression_type == WADCompressionType.ZstdChunked:
+                subchunk_toc = self.get_subchunk_toc()
+                if len(subchunk_toc) > 0:
+                    chunk.subchunks = subchunk_toc[chunk.subchunk_start:chunk.subchunk_start+chunk.subchunk_count]
+        return chunk
+
+    def get_subchunk_toc(self):
+        if self.subchunk_toc == None:
+            self.subchunk_toc = []
+            if not self.raw:
+                for toc_hash in WAD.subchunk_toc_hashes(self.path):
+                    if toc_hash in self.index:
+                        toc_chunk = self.chunk(self.index[toc_hash])
+                        toc_chunk.read_data(self.bs)
+                        self.subchunk_toc = WAD.read_subchunk_toc(toc_chunk.data)
+                        toc_chunk.free_data()
+                        break
+        return self.subchunk_toc
+
+    def get(self, key):
+        id = self.find(key)
+        return self.chunk(id) if id != None else None
+
+    def read_data(self, key, executor=None):
+        chunk = self.get(key)
+        if chunk != None:
+            chunk.read_data(self.bs, executor)
+        return chunk
+
+    def read_range(self, key, start, size=-1):
+        chunk = self.get(key)
+        return chunk.read_range(self.bs, start, size) if chunk != None else None
+
+    def verify(self, executor=None):
+        # check chunk data against the toc, nothing is decompressed:
+        # data must be inside the file, and from v3.1 the xxh3 of the compressed bytes
+        # (and of each subchunk if there is a subchunk toc) must match the checksum
+        # older checksums are not xxh3 (v3.0: from sha256), they are not checked
+        # return list of (chunk id, reason, start, end), reason: truncated or checksum
+        # chunks sharing the same bytes are checked once, reported each
+        # everything that read through self.bs (subchunk toc) is loaded here,
+        # workers only hash slices of the buffer
+        file_size = len(self.bs.buffer)
+        buffer = self.bs.buffer
+        check_sum = self.version >= 3.1
+        regions = {}
+        for id in range(len(self)):
+            regions.setdefault((self.offsets[id], self.compressed_sizes[id], self.checksums[id]), []).append(id)
+        subchunk_toc = self.get_subchunk_toc() if check_sum and any(
+            chunk_type & 15 == WADCompressionType.ZstdChunked.value for chunk_type in self.types) else []
+        tasks = []
+        for region, ids in regions.items():
+            chunk_type = self.types[ids[0]]
+            subchunks = None
+            if chunk_type & 15 == WADCompressionType.ZstdChunked.value and len(subchunk_toc) > 0:
+                subchunk_start = self.subchunk_starts[ids[0]]
+                subchunks = subchunk_toc[subchunk_start:subchunk_start + (chunk_type >> 4)]
+            tasks.append((region, subchunks))
+
+        def check(task):
+            (offset, compressed_size, checksum), subchunks = task
+            end = offset + compressed_size
+            if end > file_size:
+                return [('truncated', offset, end)]
+            if not check_sum or checksum == 0 or xxh3_64(buffer[offset:end]).intdigest() == checksum:
+                return []
+            # find bad subchunks for a tighter range
+            bad = []
+            if subchunks:
+                start = offset
+                for subchunk_size, _, subchunk_checksum in subchunks:
+                    if xxh3_64(buffer[start:start+subchunk_size]).intdigest() != subchunk_checksum:
+                        bad.append(('checksum', start, start + subchunk_size))
+                    start += subchunk_size
+            return bad if len(bad) > 0 else [('checksum', offset, end)]
+
+        results = executor.map(check, tasks) if executor != None else map(check, tasks)
+        errors = []
+        for region, bad in zip(regions, results):
+            for id in regions[region]:
+                for reason, start, end in bad:
+                    errors.append((id, reason, start, end))
+        return sorted(errors)
+
+    def read_raw(self, key):
+        # compressed bytes of a chunk as stored in the file, zero copy
+        chunk = self.get(key)
+        if chunk == None:
+            return None, None
+        self.bs.seek(chunk.offset)
+        return chunk, self.bs.read_view(chunk.compressed_size)
+
+
+class WADStat:
+    __slots__ = (
+        'path', 'is_dir', 'size', 'compressed_size',
+        'compression_type', 'wad_file', 'hash', 'extension'
+    )
+
+    def __init__(self, path=None, is_dir=None, size=None, compressed_size=None, compression_type=None, wad_file=None, hash=None, extension=None):
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+        self.compressed_size = compressed_size
+        self.compression_type = compression_type
+        self.wad_file = wad_file
+        self.hash = hash
+        self.extension = extension
+
+    def __json__(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class WADFile(io.RawIOBase):
+    # read only file object over one chunk, nothing is decompressed until read
+    # Raw and ZstdChunked (with subchunk toc) serve partial reads by range
+    # others are decompressed whole on first read
+
+    def __init__(self, wad, chunk):
+        self.wad = wad
+        self.chunk = chunk
+        self.position = 0
+        self.data = None
+        self.ranged = chunk.compression_type == WADCompressionType.Raw or (
+            chunk.compression_type == WADCompressionType.ZstdChunked and chunk.subchunks)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.chunk.decompressed_size
+        self.position = max(offset, 0)
+        return self.position
+
+    def read(self, size=-1):
+        remain = max(self.chunk.decompressed_size - self.position, 0)
+        if size == None or size < 0 or size > remain:
+            size = remain
+        if self.chunk.compression_type == WADCompressionType.Satellite:
+            raise Exception(
+                f'pyRitoFile: Error: Read WAD chunk {self.chunk.hash}: Unsupported chunk type: {self.chunk.compression_type.name}')
+        if self.data == None:
+            if self.ranged and size < remain:
+                data = self.chunk.read_range(self.wad.bs, self.position, size)
+                self.position += len(data)
+                return data
+            self.data = self.chunk.read_range(self.wad.bs, 0)
+        data = self.data[self.position:self.position+size]
+        self.position += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.data = None
+        super().close()
+
+
+class WADFileSystem:
+    # browse one or many wads as a read only folder tree, no extract
+    # names are unhashed with hashtables if given, else hex hashes
+    # paths use / and are case insensitive
+    # same path in many wads: the last wad win
+    # a path can be both a file and a dir (a/b and a/b/c), both are kept:
+    # listed once by listdir, in dirnames and filenames by walk, stat report the dir
+
+    def __init__(self, wad_files, hashtables=None):
+        if isinstance(wad_files, str):
+            wad_files = [wad_files]
+        self.wads = [WAD.open(wad_file) for wad_file in wad_files]
+        # path -> (wad, chunk id)
+        self.files = {}
+        # dir path -> child names
+        self.dirs = {'': set()}
+        for wad in self.wads:
+            for hash, id in wad.index.items():
+                path = WADHasher.hash_to_hex(hash)
+                if hashtables != None:
+                    path = WADHasher.hex_to_raw(hashtables, path)
+                key = path.lower()
+                self.files[key] = (wad, id)
+                # register all parent dirs
+                names = key.split('/')
+                parent = ''
+                for name in names[:-1]:
+                    self.dirs[parent].add(name)
+                    parent = f'{parent}/{name}' if parent else name
+                    if parent not in self.dirs:
+                        self.dirs[parent] = set()
+                self.dirs[parent].add(names[-1])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for wad in self.wads:
+            wad.close()
+
+    @staticmethod
+    def normpath(path):
+        return path.replace('\\', '/').strip('/').lower()
+
+    def exists(self, path):
+        path = WADFileSystem.normpath(path)
+        return path in self.files or path in self.dirs
+
+    def isdir(self, path):
+        return WADFileSystem.normpath(path) in self.dirs
+
+    def isfile(self, path):
+        return WADFileSystem.normpath(path) in self.files
+
+    def listdir(self, path=''):
+        path = WADFileSystem.normpath(path)
+        if path not in self.dirs:
+            raise FileNotFoundError(f'pyRitoFile: Error: WADFileSystem: No such directory: {path}')
+        return sorted(self.dirs[path])
+
+    def stat(self, path):
+        path = WADFileSystem.normpath(path)
+        if path in self.dirs:
+            return WADStat(path=path, is_dir=True, size=0)
+        if path not in self.files:
+            raise FileNotFoundError(f'pyRitoFile: Error: WADFileSystem: No such file: {path}')
+        wad, id = self.files[path]
+        chunk = wad.chunk(id)
+        return WADStat(
+            path=path,
+            is_dir=False,
+            size=chunk.decompressed_size,
+            compressed_size=chunk.compressed_size,
+            compression_type=chunk.compression_type,
+            wad_file=wad.path,
+            hash=chunk.hash,
+            extension=chunk.extension or WADExtensioner.get_extension(path) or chunk.probe_extension(wad.bs)
+        )
+
+    def open(self, path):
+        path = WADFileSystem.normpath(path)
+        if path not in self.files:
+            raise FileNotFoundError(f'pyRitoFile: Error: WADFileSystem: No such file: {path}')
+        wad, id = self.files[path]
+        return WADFile(wad, wad.chunk(id))
+
+    def read_file(self, path):
+        # whole decompressed data, ex: SKN().read(fs.read_file(path), raw=True)
+        with self.open(path) as f:
+            return f.read()
+
+    def walk(self, top=''):
+        # like os.walk, top down
+        top = WADFileSystem.normpath(top)
+        if top not in self.dirs:
+            return
+        stack = [top]
+        while len(stack) > 0:
+            path = stack.pop()
+            prefix = f'{path}/' if path else ''
+            dirnames = sorted(name for name in self.dirs[path] if prefix + name in self.dirs)
+            filenames = sorted(name for name in self.dirs[path] if prefix + name in self.files)
+            yield path, dirnames, filenames
+            # caller can prune dirnames like os.walk
+            for name in reversed(dirnames):
+                stack.append(f'{path}/{name}' if path else name)
+
+
+class WADPatcher:
+    # edit chunks of an existing wad without rewriting the whole file
+    # new data overwrite the old bytes when it fits, else it goes in
+    # the first gap big enough (free list), else at the end of data
+    # trailing free space is cut off on close
+    # only version 3 toc layout (272 bytes header, 32 bytes entries)
+
+    def __init__(self, path):
+        self.path = path
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(self):
+        with WAD.open(self.path) as wad:
+            if int(wad.version) != 3:
+                raise Exception(
+                    f'pyRitoFile: Error: Patch WAD {self.path}: Unsupported file version: {wad.version}')
+            self.chunks = [wad.chunk(id) for id in range(len(wad))]
+        self.bs = BytesStream.updater(self.path)
+        self.index = {WADHasher.raw_or_hex_to_hash(chunk.hash): chunk for chunk in self.chunks}
+        # data offset -> chunks that point to those bytes
+        self.refs = {}
+        # (checksum, compressed size, decompressed size) -> chunk, for dedup
+        self.duplicates = {}
+        for chunk in self.chunks:
+            self.refs.setdefault(chunk.offset, []).append(chunk)
+            self.duplicates[WADPatcher.data_key(chunk)] = chunk
+        # free list: sorted [offset, size] gaps in data region
+        # self.end: end of used data, everything after is free
+        self.free = []
+        self.end = 272 + len(self.chunks) * 32
+        for offset in sorted(self.refs):
+            size = max(chunk.compressed_size for chunk in self.refs[offset])
+            if offset > self.end:
+                self.free.append([self.end, offset - self.end])
+            self.end = max(self.end, offset + size)
+
+    @staticmethod
+    def data_key(chunk):
+        return (chunk.checksum, chunk.compressed_size, chunk.decompressed_size)
+
+    def free_size(self):
+        self.bs.seek(0, 2)
+        return sum(size for _, size in self.free) + self.bs.tell() - self.end
+
+    def release(self, offset, size):
+        # give bytes back to free list, merge with neighbour gaps
+        i = bisect_left(self.free, [offset, 0])
+        if i < len(self.free) and offset + size == self.free[i][0]:
+            size += self.free.pop(i)[1]
+        if i > 0 and self.free[i-1][0] + self.free[i-1][1] == offset:
+            i -= 1
+            offset = self.free[i][0]
+            size += self.free.pop(i)[1]
+        if offset + size >= self.end:
+            # gap at end of data: just move the end back
+            self.end = offset
+        else:
+            self.free.insert(i, [offset, size])
+
+    def alloc(self, size, prefer=None):
+        # prefer: try this offset first (old bytes of the chunk)
+        # then first fit, then end of data
+        found = None
+        if prefer != None:
+            for i, (offset, free_size) in enumerate(self.free):
+                if offset <= prefer and prefer + size <= offset + free_size:
+                    found = i, prefer
+                    break
+        if found == None:
+            for i, (offset, free_size) in enumerate(self.free):
+                if size <= free_size:
+                    found = i, offset
+                    break
+        if found == None:
+            offset = self.end
+            self.end += size
+            return offset
+        i, offset = found
+        free_offset, free_size = self.free.pop(i)
+        # put back what is left on both sides
+        if offset + size < free_offset + free_size:
+            self.free.insert(i, [offset + size, free_offset + free_size - offset - size])
+        if free_offset < offset:
+            self.free.insert(i, [free_offset, offset - free_offset])
+        return offset
+
+    @staticmethod
+    def patch_entry(bs, chunk):
+        bs.patch_fmt(
+            272 + chunk.id * 32, '<QIIIB?HQ',
+            WADHasher.raw_or_hex_to_hash(chunk.hash),
+            chunk.offset,
+            chunk.compressed_size,
+            chunk.decompressed_size,
+            chunk.compression_type.value | (chunk.subchunk_count << 4),
+            chunk.duplicated,
+            chunk.subchunk_start,
+            chunk.checksum
+        )
+
+    def patch_duplicated(self, chunk, duplicated):
+        # whole entry, so a later patch of the same entry always win
+        if chunk.duplicated != duplicated:
+            chunk.duplicated = duplicated
+            WADPatcher.patch_entry(self.bs, chunk)
+
+    def replace(self, key, chunk_data, level=None):
+        # key: int hash, hex string or raw path
+        if not isinstance(key, int):
+            key = WADHasher.raw_or_hex_to_hash(key)
+        chunk = self.index.get(key)
+        if chunk == None:
+            raise Exception(
+                f'pyRitoFile: Error: Patch WAD {self.path}: Chunk not found: {WADHasher.hash_to_hex(key)}')
+        old_offset, old_size = chunk.offset, chunk.compressed_size
+        chunk.compress_data(chunk_data, level)
+        chunk.subchunk_start = 0
+        chunk.subchunk_count = 0
+        chunk.subchunks = None
+        # old bytes are free once no other chunk point to them
+        shared = self.refs[old_offset]
+        shared.remove(chunk)
+        if len(shared) == 0:
+            del self.refs[old_offset]
+            self.release(old_offset, old_size)
+        elif len(shared) == 1:
+            self.patch_duplicated(shared[0], False)
+        # same data already in file: point to it
+        data_key = WADPatcher.data_key(chunk)
+        duped_chunk = self.duplicates.get(data_key)
+        if duped_chunk != None and duped_chunk is not chunk and WADPatcher.data_key(duped_chunk) == data_key:
+            chunk.offset = duped_chunk.offset
+            chunk.duplicated = True
+            for shared_chunk in self.refs[chunk.offset]:
+                self.patch_duplicated(shared_chunk, True)
+        else:
+            chunk.offset = self.alloc(chunk.compressed_size, prefer=old_offset)
+            chunk.duplicated = False
+            self.bs.seek(chunk.offset)
+            self.bs.write(chunk.data)
+            self.duplicates[data_key] = chunk
+        self.refs.setdefault(chunk.offset, []).append(chunk)
+        WADPatcher.patch_entry(self.bs, chunk)
+        chunk.free_data()
+        return chunk
+
+    def close(self):
+        self.bs.apply_patches()
+        self.bs.stream.truncate(max(self.end, 272 + len(self.chunks) * 32))
+        self.bs.close()
+
+    def compact(self):
+        # rewrite data region sequentially in toc order, no gaps
+        # written to a temp file then swapped with the wad
+        self.bs.apply_patches()
+        tmp_path = self.path + '.tmp'
+        moved = {}
+        with BytesStream.writer(tmp_path, in_memory=False) as bs:
+            self.bs.seek(0)
+            bs.write(self.bs.read(272))
+            bs.write(bytes(32 * len(self.chunks)))
+            for chunk in self.chunks:
+                if chunk.offset not in moved:
+                    self.bs.seek(chunk.offset)
+                    moved[chunk.offset] = bs.tell()
+                    bs.write(self.bs.read(chunk.compressed_size))
+            for chunk in self.chunks:
+                chunk.offset = moved[chunk.offset]
+                WADPatcher.patch_entry(bs, chunk)
+        self.bs.close()
+        os.replace(tmp_path, self.path)
+        self.load()
@@ -77,15 +77,10 @@ class WPK:
                 bs.write_c_sep_0(wem_id)
             # wem datas
             for i, wem_data in enumerate(wem_datas):
-                data_offset = bs.tell()
-                bs.seek(wem_data_offsets[i])
-                bs.write_u32(data_offset)
-                bs.seek(data_offset)
+                bs.patch_u32(wem_data_offsets[i], bs.tell())
                 bs.write(wem_data)
             # wem offsets
-            bs.seek(12)
-            for wem_offset in wem_offsets:
-                bs.write_u32(wem_offset)
+            bs.patch_u32(12, *wem_offsets)
 
             return bs.raw() if raw else None 
 
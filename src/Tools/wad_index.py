@@ -0,0 +1,171 @@
+from . import lepath, pyRitoFile
+from concurrent.futures import ThreadPoolExecutor
+import os, sqlite3
+
+# 游戏wad索引
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS wads (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    mtime_ns INTEGER,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    hash INTEGER,
+    wad_id INTEGER,
+    offset INTEGER,
+    compressed_size INTEGER,
+    decompressed_size INTEGER,
+    compression_type INTEGER,
+    subchunk_start INTEGER,
+    subchunk_count INTEGER,
+    checksum INTEGER,
+    extension TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (hash);
+CREATE INDEX IF NOT EXISTS chunks_extension ON chunks (extension);
+CREATE INDEX IF NOT EXISTS chunks_wad_id ON chunks (wad_id);
+'''
+
+# sqlite integers are signed 64 bits
+def to_i64(value): return value - (1 << 64) if value >= (1 << 63) else value
+def to_u64(value): return value + (1 << 64) if value < 0 else value
+
+
+def scan_wad(wad_file):
+    # toc rows of one wad, extension probed from the first bytes of each chunk
+    rows = []
+    with pyRitoFile.wad.WAD.open(wad_file) as wad:
+        for chunk in wad:
+            rows.append((
+                to_i64(wad.hashes[chunk.id]),
+                chunk.offset,
+                chunk.compressed_size,
+                chunk.decompressed_size,
+                chunk.compression_type.value,
+                chunk.subchunk_start,
+                chunk.subchunk_count,
+                to_i64(chunk.checksum),
+                chunk.probe_extension(wad.bs)
+            ))
+    return rows
+
+
+class WADIndex:
+    # sqlite index of every chunk of every wad under a game folder:
+    # path hash -> wad file, offset, sizes, compression, checksum, extension
+    # wad paths are stored relative to client_dir
+    # update() only rescan wads that were added or whose mtime/size changed
+
+    def __init__(self, db_file, client_dir):
+        self.db_file = db_file
+        self.client_dir = str(client_dir)
+        self.db = sqlite3.connect(db_file)
+        self.db.executescript(SCHEMA)
+
+    @staticmethod
+    def default(client_dir=None):
+        # index of LOL_CLIENT_DIR (or client_dir), stored next to the app
+        from Core.paths import PROJECT_DIR, LOL_CLIENT_DIR
+        return WADIndex(str(PROJECT_DIR / 'wad_index.db'), client_dir or LOL_CLIENT_DIR)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, jobs=1):
+        print(f'wad_index: Start:  Update index: {self.client_dir}')
+        wad_files = {
+            lepath.rel(wad_file, self.client_dir): wad_file
+            for wad_file in lepath.walk(self.client_dir, lambda file: file.endswith('.wad.client'))
+        }
+        indexed = {path: (id, mtime_ns, size) for id, path, mtime_ns, size in self.db.execute('SELECT id, path, mtime_ns, size FROM wads')}
+        # drop removed and changed wads
+        changed = []
+        for path, wad_file in wad_files.items():
+            wad_stat = os.stat(wad_file)
+            if path in indexed and indexed[path][1:] == (wad_stat.st_mtime_ns, wad_stat.st_size):
+                continue
+            changed.append((path, wad_stat))
+        changed_paths = set(path for path, _ in changed)
+        with self.db:
+            for path, (id, _, _) in indexed.items():
+                if path not in wad_files or path in changed_paths:
+                    self.db.execute('DELETE FROM chunks WHERE wad_id = ?', (id,))
+                    self.db.execute('DELETE FROM wads WHERE id = ?', (id,))
+        # scan in worker threads, insert here (sqlite connection is not shared)
+        # a wad that can not be read is skipped, it is not in wads table so next update retry it
+        def try_scan_wad(item):
+            try:
+                return scan_wad(wad_files[item[0]]), None
+            except Exception as e:
+                return None, e
+
+        bad_wads = {}
+        with ThreadPoolExecutor(max(jobs, 1)) as executor:
+            for (path, wad_stat), (rows, error) in zip(changed, executor.map(try_scan_wad, changed)):
+                if error != None:
+                    print(f'wad_index: Error: Index: {path}: {error}')
+                    bad_wads[path] = str(error)
+                    continue
+                with self.db:
+                    id = self.db.execute(
+                        'INSERT INTO wads (path, mtime_ns, size) VALUES (?, ?, ?)',
+                        (path, wad_stat.st_mtime_ns, wad_stat.st_size)
+                    ).lastrowid
+                    self.db.executemany(
+                        'INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        ((row[0], id) + row[1:] for row in rows)
+                    )
+                print(f'wad_index: Finish: Index: {path}: {len(rows)} chunks')
+        print(f'wad_index: Finish: Update index: {len(changed) - len(bad_wads)} changed, {len(bad_wads)} failed, {len(wad_files)} wads')
+        # return {wad path: error} of skipped wads
+        return bad_wads
+
+    def query(self, where, params):
+        # -> list of (wad file, WADChunk)
+        rows = self.db.execute(
+            'SELECT wads.path, chunks.hash, chunks.offset, chunks.compressed_size, chunks.decompressed_size, '
+            'chunks.compression_type, chunks.subchunk_start, chunks.subchunk_count, chunks.checksum, chunks.extension '
+            f'FROM chunks JOIN wads ON wads.id = chunks.wad_id WHERE {where}',
+            params
+        )
+        return [(
+            lepath.join(self.client_dir, path),
+            pyRitoFile.wad.WADChunk(
+                hash=pyRitoFile.wad.WADHasher.hash_to_hex(to_u64(hash)),
+                offset=offset,
+                compressed_size=compressed_size,
+                decompressed_size=decompressed_size,
+                compression_type=pyRitoFile.wad.WADCompressionType(compression_type),
+                subchunk_start=subchunk_start,
+                subchunk_count=subchunk_count,
+                checksum=to_u64(checksum),
+                extension=extension
+            )
+        ) for path, hash, offset, compressed_size, decompressed_size, compression_type, subchunk_start, subchunk_count, checksum, extension in rows]
+
+    def find(self, key):
+        # where does this asset live
+        # key: int hash, hex string or raw path
+        if not isinstance(key, int):
+            key = pyRitoFile.wad.WADHasher.raw_or_hex_to_hash(key)
+        return self.query('chunks.hash = ?', (to_i64(key),))
+
+    def list_extension(self, extension):
+        # all chunks of a type, ex: bin
+        return self.query('chunks.extension = ?', (extension,))
+
+    def read_data(self, key):
+        # chunk with data, from the first wad that has it
+        for wad_file, _ in self.find(key):
+            with pyRitoFile.wad.WAD.open(wad_file) as wad:
+                chunk = wad.read_data(key)
+                if chunk != None:
+                    return chunk
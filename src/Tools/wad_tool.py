@@ -1,64 +1,153 @@
 from . import lepath, pyRitoFile
-import os, json
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import os, json, re, fnmatch
 
 # 解包wad文件
 
-def unpack(wad_file, raw_dir, hashtables, filter=None):
+def compile_patterns(patterns):
+    # patterns: glob strings (case insensitive, * also match /, ex: *.skn, data/characters/ahri/**)
+    # matched against the whole path
+    # or compiled regex (searched in the path)
+    # return a function path -> bool, true if any pattern match
+    globs = [pattern for pattern in patterns if isinstance(pattern, str)]
+    regexes = [pattern for pattern in patterns if not isinstance(pattern, str)]
+    glob_regex = re.compile('|'.join(fnmatch.translate(glob) for glob in globs), re.IGNORECASE) if len(globs) > 0 else None
+    return lambda path: (glob_regex != None and glob_regex.fullmatch(path) != None) or any(regex.search(path) for regex in regexes)
+
+
+def unpack(wad_file, raw_dir, hashtables, filter=None, jobs=1, max_inflight=256*1024**2, patterns=None):
+    # filter: container of chunk hashes (unhashed paths) to extract
+    # patterns: globs/regexes matched against unhashed paths, see compile_patterns
+    # hashed chunks are matched by their hex name
+    # both are applied on the toc, before any data is read
+    # jobs > 1: decompress chunks in a thread pool (zstd/zlib release the GIL)
+    # and write files through a second pool, at most max_inflight
+    # decompressed bytes are held in memory at once
     print(f'wad_tool: Start:  Unpack WAD: {wad_file}')
     # read wad
     wad = pyRitoFile.wad.WAD().read(wad_file)
     wad.un_hash(hashtables)
     hashed_files = {}
-    # create dirs first
-    with pyRitoFile.stream.BytesStream.reader(wad_file) as bs:
-        for chunk in wad.chunks:
-            file_path = lepath.join(raw_dir, chunk.hash)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    match = compile_patterns(patterns) if patterns else None
+    chunks = [
+        chunk for chunk in wad.chunks
+        if (filter == None or chunk.hash in filter) and (match == None or match(chunk.hash))
+    ]
+    # create dirs first, only the ones needed
+    dirs = set()
+    for chunk in chunks:
+        dirs.add(os.path.dirname(lepath.join(raw_dir, chunk.hash)))
+    for dir in dirs:
+        os.makedirs(dir, exist_ok=True)
+
+    def get_file_path(chunk):
+        # output file path of this chunk
+        file_path = lepath.join(raw_dir, chunk.hash)
+        # add extension to hashed file if know
+        if pyRitoFile.wad.WADHasher.is_hash(chunk.hash) and chunk.extension != None:
+            ext = f'.{chunk.extension}'
+            if not file_path.endswith(ext):
+                file_path += ext
+
+        should_be_hashed = False
+        # hash file with long basename
+        if len(os.path.basename(file_path)) > 255:
+            should_be_hashed = True
+        # hash file same name with dir
+        if os.path.exists(file_path) and os.path.isdir(file_path):
+            should_be_hashed = True
+        if should_be_hashed:
+            basename = pyRitoFile.wad.WADHasher.raw_to_hex(chunk.hash)
+            if chunk.extension != None:
+                basename += f'.{chunk.extension}'
+            hashed_file =  lepath.join(raw_dir, basename)
+            hashed_files[basename] = chunk.hash
+            file_path = hashed_file
+        return file_path
+
+    def write_file(file_path, chunk):
+        # write out chunk data to file
+        with open(file_path, 'wb') as fo:
+            fo.write(chunk.data)
+        chunk.free_data()
+        print(f'wad_tool: Finish: Unpack: {chunk.hash}')
+
     # actual extract
     with pyRitoFile.stream.BytesStream.reader(wad_file) as bs:
-        for chunk in wad.chunks:
-            if filter != None and chunk.hash not in filter:
-                continue
-            # read chunk data first to get extension
-            chunk.read_data(bs)
-            # output file path of this chunk
-            file_path = lepath.join(raw_dir, chunk.hash)
-            # add extension to hashed file if know
-            if pyRitoFile.wad.WADHasher.is_hash(chunk.hash) and chunk.extension != None:
-                ext = f'.{chunk.extension}'
-                if not file_path.endswith(ext):
-                    file_path += ext
-
-            should_be_hashed = False
-            # hash file with long basename
-            if len(os.path.basename(file_path)) > 255:
-                should_be_hashed = True
-            # hash file same name with dir
-            if os.path.exists(file_path) and os.path.isdir(file_path):
-                should_be_hashed = True
-            if should_be_hashed:
-                basename = pyRitoFile.wad.WADHasher.raw_to_hex(chunk.hash)
-                if chunk.extension != None:
-                    basename += f'.{chunk.extension}'
-                hashed_file =  lepath.join(raw_dir, basename)
-                hashed_files[basename] = chunk.hash
-                file_path = hashed_file
-            # write out chunk data to file
-            with open(file_path, 'wb') as fo:
-                fo.write(chunk.data)
-            chunk.free_data()
-            print(f'wad_tool: Finish: Unpack: {chunk.hash}')
-    # remove empty dirs
-    for root, dirs, files in os.walk(raw_dir, topdown=False):
-        if len(os.listdir(root)) == 0:
-            os.rmdir(root)
+        if jobs <= 1:
+            for chunk in chunks:
+                # read chunk data first to get extension
+                chunk.read_data(bs)
+                write_file(get_file_path(chunk), chunk)
+        else:
+            with ThreadPoolExecutor(jobs) as decompressors, ThreadPoolExecutor(max(jobs // 2, 1)) as writers:
+                # both queues are kept in wad order
+                # so file names and hashed_files.json match the sequential path
+                decompressing = deque()
+                writing = deque()
+                # last write per path, in case two chunks land on the same file
+                # (case insensitive file system), the later one must win
+                last_writes = {}
+                inflight = 0
+
+                def hand_over():
+                    # oldest decompressed chunk -> writer pool
+                    chunk, future = decompressing.popleft()
+                    future.result()
+                    file_path = get_file_path(chunk)
+                    key = os.path.normcase(file_path)
+                    if key in last_writes:
+                        last_writes[key].result()
+                    future = last_writes[key] = writers.submit(write_file, file_path, chunk)
+                    writing.append((chunk.decompressed_size, future))
+
+                def finish_write():
+                    nonlocal inflight
+                    size, future = writing.popleft()
+                    future.result()
+                    inflight -= size
+
+                for chunk in chunks:
+                    while inflight > max_inflight and (len(decompressing) > 0 or len(writing) > 0):
+                        if len(decompressing) > 0:
+                            hand_over()
+                        else:
+                            finish_write()
+                    while len(decompressing) > 0 and decompressing[0][1].done():
+                        hand_over()
+                    while len(writing) > 0 and writing[0][1].done():
+                        finish_write()
+                    bs.seek(chunk.offset)
+                    decompressing.append((chunk, decompressors.submit(
+                        chunk.decompress_data, bs.read_view(chunk.compressed_size))))
+                    inflight += chunk.decompressed_size
+                while len(decompressing) > 0:
+                    hand_over()
+                while len(writing) > 0:
+                    finish_write()
+    # remove empty dirs we created (files moved to hashed names), deepest first
+    raw_dir_abs = os.path.abspath(raw_dir)
+    parents = set()
+    for dir in dirs:
+        dir = os.path.abspath(dir)
+        while dir not in parents and len(dir) > len(raw_dir_abs):
+            parents.add(dir)
+            dir = os.path.dirname(dir)
+    parents.add(raw_dir_abs)
+    for dir in sorted(parents, key=len, reverse=True):
+        if os.path.isdir(dir) and len(os.listdir(dir)) == 0:
+            os.rmdir(dir)
     # write hashed bins json
     if len(hashed_files) > 0:
         with open(lepath.join(raw_dir, 'hashed_files.json'), 'w+', encoding='utf-8') as f:
             json.dump(hashed_files, f, indent=4, ensure_ascii=False)
 
 
-def pack(raw_dir, wad_file):
+def pack(raw_dir, wad_file, jobs=1, level=None, incremental=False):
+    # level: zstd compression level, None = zstd default
+    # incremental: keep a manifest next to the wad and reuse compressed data
+    # of files that did not change since the last incremental pack
     print(f'wad_tool: Start:  Pack WAD: {raw_dir}')
     # create wad first with only infos
     chunk_datas = []
@@ -83,16 +172,157 @@ def pack(raw_dir, wad_file):
             else:
                 chunk_hashes.append(lepath.rel(file_path, raw_dir))
     # write wad
+    # data region is written in order, right after header + toc
+    # toc entries are patched in and written once, on close
     wad = pyRitoFile.wad.WAD()
     wad.chunks = [pyRitoFile.wad.WADChunk.default()
                   for id in range(len(chunk_hashes))]
-    wad.write(wad_file)
-    # write wad chunk
-    with pyRitoFile.stream.BytesStream.updater(wad_file) as bs:
-        for id, chunk in enumerate(wad.chunks):
+
+    # dedup index of stored chunks, see WADChunk.store_data
+    duplicates = {}
+    # raw data key -> id of first chunk with that data
+    # identical files are compressed once, others copy its infos on store
+    raw_sources = {}
+    dup_sources = {}
+
+    # manifest: chunk hash -> [mtime_ns, size, raw xxh3_128]
+    # only trusted if the wad is still the one it was written with
+    manifest_file = wad_file + '.manifest.json'
+    old_wad = None
+    old_files = {}
+    new_files = {}
+    if incremental and os.path.exists(wad_file) and os.path.exists(manifest_file):
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            wad_stat = os.stat(wad_file)
+            if manifest.get('level') == level and manifest.get('wad') == [wad_stat.st_mtime_ns, wad_stat.st_size]:
+                old_files = dict(manifest['files'])
+                old_wad = pyRitoFile.wad.WAD.open(wad_file)
+        except Exception as e:
+            # broken manifest: full pack, a new one is written after
+            print(f'wad_tool: Error: Pack WAD: {manifest_file}: {e}')
+            old_files = {}
+
+    def read(id):
+        # return raw data to compress, or None if the chunk is ready:
+        # reused from old wad, or an earlier chunk has the same data
+        chunk = wad.chunks[id]
+        chunk.hash = chunk_hashes[id]
+        file_stat = os.stat(chunk_datas[id])
+        old_file = old_files.get(chunk.hash)
+        if old_file != None and old_file[:2] == [file_stat.st_mtime_ns, file_stat.st_size]:
+            # untouched since last pack, no need to read it
+            data = None
+            raw_key = (file_stat.st_size, bytes.fromhex(old_file[2]))
+        else:
+            with open(chunk_datas[id], 'rb') as f:
+                data = f.read()
+            raw_key = pyRitoFile.wad.WADChunk.raw_data_key(data)
+        if incremental:
+            new_files[chunk.hash] = [file_stat.st_mtime_ns, file_stat.st_size, raw_key[1].hex()]
+        if raw_key in raw_sources:
+            dup_sources[id] = raw_sources[raw_key]
+            return None
+        raw_sources[raw_key] = id
+        if old_file != None and old_file[1:] == new_files[chunk.hash][1:]:
+            # same data as last pack, take its compressed bytes as they are
+            old_chunk, chunk.data = old_wad.read_raw(chunk.hash)
+            if old_chunk != None:
+                chunk.copy_data_info(old_chunk)
+                print(f'wad_tool: Reuse: {chunk.hash}')
+                return None
+        if data == None:
             with open(chunk_datas[id], 'rb') as f:
-                chunk_data = f.read()
-            chunk.write_data(bs, id, chunk_hashes[id], chunk_data, previous_chunks=wad.chunks[:id])
-            chunk.free_data()
-            print(f'wad_tool: Finish: Pack: {chunk.hash}')
+                data = f.read()
+        return data
+
+    def compress(id, data):
+        chunk = wad.chunks[id]
+        chunk.compress_data(data, level)
+        return chunk
+
+    def store(id, chunk=None):
+        if chunk == None:
+            chunk = wad.chunks[id]
+            if id in dup_sources:
+                # source chunk is always stored before
+                chunk.copy_data_info(wad.chunks[dup_sources.pop(id)])
+        chunk.store_data(bs, id, duplicates=duplicates)
+        chunk.free_data()
+        print(f'wad_tool: Finish: Pack: {chunk.hash}')
+
+    # old wad is mapped while we write, so write next to it and swap after
+    out_file = wad_file + '.tmp' if old_wad != None else wad_file
+    with pyRitoFile.stream.BytesStream.writer(out_file, in_memory=False) as bs:
+        wad.write_header(bs)
+        bs.write(bytes(32 * len(wad.chunks)))
+        if jobs <= 1:
+            for id in range(len(wad.chunks)):
+                data = read(id)
+                store(id, None if data == None else compress(id, data))
+        else:
+            # compress in a thread pool (zstd release the GIL)
+            # at most jobs*2 chunks compressed ahead of the writer
+            # files are read in order here so a dup always comes after its source
+            with ThreadPoolExecutor(jobs) as compressors:
+                compressing = deque()
+
+                def store_oldest():
+                    id, future = compressing.popleft()
+                    store(id, None if future == None else future.result())
+
+                for id in range(len(wad.chunks)):
+                    if len(compressing) >= jobs * 2:
+                        store_oldest()
+                    data = read(id)
+                    compressing.append((id, None if data == None else compressors.submit(compress, id, data)))
+                    # store the finished ones
+                    while len(compressing) > 0 and (compressing[0][1] == None or compressing[0][1].done()):
+                        store_oldest()
+                while len(compressing) > 0:
+                    store_oldest()
+    if old_wad != None:
+        old_wad.close()
+        os.replace(out_file, wad_file)
+    if incremental:
+        wad_stat = os.stat(wad_file)
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'level': level,
+                'wad': [wad_stat.st_mtime_ns, wad_stat.st_size],
+                'files': new_files
+            }, f)
+
+
+def compact(wad_file):
+    # drop the space left behind by in place chunk edits
+    print(f'wad_tool: Start:  Compact WAD: {wad_file}')
+    old_size = os.path.getsize(wad_file)
+    with pyRitoFile.wad.WADPatcher(wad_file) as patcher:
+        patcher.compact()
+    print(f'wad_tool: Finish: Compact WAD: {wad_file}: {old_size} -> {os.path.getsize(wad_file)} bytes')
+
 
+def verify(path, jobs=1):
+    # path: a wad or a folder of wads (ex: game folder)
+    # return {wad file: [(chunk hash, reason, start, end)]} of bad wads only
+    wad_files = [path] if os.path.isfile(path) else lepath.walk(path, lambda file: file.endswith('.wad.client'))
+    print(f'wad_tool: Start:  Verify: {path}: {len(wad_files)} wads')
+    bad_wads = {}
+    with ThreadPoolExecutor(max(jobs, 1)) as executor:
+        for wad_file in wad_files:
+            try:
+                with pyRitoFile.wad.WAD.open(wad_file) as wad:
+                    errors = [
+                        (pyRitoFile.wad.WADHasher.hash_to_hex(wad.hashes[id]), reason, start, end)
+                        for id, reason, start, end in wad.verify(executor if jobs > 1 else None)
+                    ]
+            except Exception as e:
+                errors = [(None, str(e), 0, 0)]
+            for hash, reason, start, end in errors:
+                print(f'wad_tool: Error: Verify: {wad_file}: {hash}: {reason}: bytes {start}-{end}')
+            if len(errors) > 0:
+                bad_wads[wad_file] = errors
+    print(f'wad_tool: Finish: Verify: {path}: {len(wad_files) - len(bad_wads)}/{len(wad_files)} wads ok')
+    return bad_wads
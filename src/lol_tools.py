@@ -5,7 +5,7 @@ from qfluentwidgets import FluentWindow, NavigationItemPosition
 from FileBrowser.file_browser import FileBrowserApp as BrowserApp
 from Core.setting_view import SettingView
 from Core.paths import LOL_OUT_DIR
-import os
+import os, multiprocessing
 
 class MainView(FluentWindow):
     def __init__(
@@ -56,6 +56,8 @@ def create_necessary_directories():
             os.makedirs(directory)
 
 if __name__ == "__main__":
+    # hash_helper combine hashes in worker processes
+    multiprocessing.freeze_support()
     # 创建必要的目录
     create_necessary_directories()
     
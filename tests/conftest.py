@@ -0,0 +1,4 @@
+import os, sys
+
+# tools are imported as Tools.*, like the app does from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
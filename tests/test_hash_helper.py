@@ -0,0 +1,130 @@
+import os, random
+import pytest
+from Tools import hash_helper
+from Tools.hash_helper import HashTable, CustomHashes
+
+
+def write_txt(path, hashes):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f'{hex} {raw}\n' for hex, raw in hashes.items())
+
+
+def random_hashes(rng, count, sep):
+    return {f'{rng.getrandbits(sep * 4):0{sep}x}': f'data/path_{i}/é_{rng.random()}.bin' for i in range(count)}
+
+
+@pytest.mark.parametrize('sep', (8, 16))
+def test_hashtable_matches_dict(tmp_path, sep):
+    rng = random.Random(sep)
+    hashes = random_hashes(rng, 5000, sep)
+    txt_file = str(tmp_path / 'hashes.txt')
+    write_txt(txt_file, hashes)
+    HashTable.compile(txt_file, txt_file + '.lht', sep)
+    table = HashTable(txt_file + '.lht')
+    try:
+        assert len(table) == len(hashes)
+        assert dict(table.items()) == hashes
+        assert list(table) == sorted(hashes)
+        missing = [f'{rng.getrandbits(sep * 4):0{sep}x}' for _ in range(500)]
+        missing = [hex for hex in missing if hex not in hashes]
+        for hex, raw in hashes.items():
+            assert table.get(hex) == raw
+            assert table[hex] == raw
+            assert table.find(hex) != None
+        for hex in missing + ['', 'zz' * (sep // 2), '0' * (sep + 2), None, 123]:
+            assert hex not in table
+            assert table.get(hex, 'default') == 'default'
+            assert table.find(hex) == None
+        with pytest.raises(KeyError):
+            table[missing[0]]
+        keys = list(hashes)[:1000] + missing
+        rng.shuffle(keys)
+        assert table.get_many(keys) == {hex: hashes[hex] for hex in keys if hex in hashes}
+        assert table.get_many(keys + ['not hex!' + '0' * (sep - 8)]) == {hex: hashes[hex] for hex in keys if hex in hashes}
+    finally:
+        table.close()
+
+
+def test_hashtable_compile_unsorted_and_duplicates(tmp_path):
+    # later lines win, like the dict it replaces
+    txt_file = str(tmp_path / 'hashes.txt')
+    with open(txt_file, 'w', encoding='utf-8') as f:
+        f.write('ffffffff max\n00000002 two\n00000001 one\n00000002 two again\nnot_hex! bad\n')
+    HashTable.compile(txt_file, txt_file + '.lht', 8)
+    table = HashTable(txt_file + '.lht')
+    try:
+        assert list(table.items()) == [('00000001', 'one'), ('00000002', 'two again'), ('ffffffff', 'max')]
+    finally:
+        table.close()
+
+
+def test_hashtable_empty(tmp_path):
+    txt_file = str(tmp_path / 'hashes.txt')
+    open(txt_file, 'w').close()
+    HashTable.compile(txt_file, txt_file + '.lht', 16)
+    table = HashTable(txt_file + '.lht')
+    try:
+        assert len(table) == 0
+        assert list(table.items()) == []
+        assert table.get('0' * 16) == None
+        assert table.get_many(['0' * 16]) == {}
+    finally:
+        table.close()
+
+
+def compiled_files(dir, filename):
+    return sorted(name for name in os.listdir(dir) if name.startswith(filename + '.') and name.endswith('.lht'))
+
+
+def test_custom_hashes_recompile(tmp_path, monkeypatch):
+    monkeypatch.setattr(CustomHashes, 'local_dir', str(tmp_path))
+    filename = 'hashes.game.txt'
+    local_file = CustomHashes.local_file(filename)
+    write_txt(local_file, {'0000000000000001': 'one'})
+    # stale file from an older layout
+    open(str(tmp_path / f'{filename}.lht'), 'wb').close()
+
+    table = CustomHashes.load_hashes(filename)
+    assert table.get('0000000000000001') == 'one'
+    first = compiled_files(tmp_path, filename)
+    assert first == [os.path.basename(CustomHashes.compiled_file(filename))]
+    table.close()
+
+    # same txt: no compile
+    table = CustomHashes.load_hashes(filename)
+    assert compiled_files(tmp_path, filename) == first
+    table.close()
+
+    # newer txt: new compiled file, old one removed
+    write_txt(local_file, {'0000000000000001': 'one again'})
+    stat = os.stat(local_file)
+    os.utime(local_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    table = CustomHashes.load_hashes(filename)
+    assert table.get('0000000000000001') == 'one again'
+    second = compiled_files(tmp_path, filename)
+    assert len(second) == 1 and second != first
+    table.close()
+
+    # new layout version: recompile
+    monkeypatch.setattr(HashTable, 'VERSION', HashTable.VERSION + 1)
+    table = CustomHashes.load_hashes(filename)
+    assert table.get('0000000000000001') == 'one again'
+    third = compiled_files(tmp_path, filename)
+    assert len(third) == 1 and third != second
+    table.close()
+
+
+def test_hashtables_only_open_acquired(tmp_path, monkeypatch):
+    monkeypatch.setattr(CustomHashes, 'local_dir', str(tmp_path))
+    for filename in hash_helper.ALL_HASHES:
+        write_txt(CustomHashes.local_file(filename), {})
+    hashtables = hash_helper.HashTables(hash_helper.ALL_HASHES)
+    hashtables.acquire(*hash_helper.WAD_HASHES)
+    assert set(hashtables) == set(hash_helper.WAD_HASHES)
+    assert 'hashes.binhashes.txt' not in hashtables
+    with pytest.raises(KeyError):
+        hashtables['hashes.binhashes.txt']
+    hashtables['hashes.game.txt']
+    hashtables.release(*hash_helper.WAD_HASHES)
+    assert list(hashtables) == []
+    assert hashtables.tables == {}
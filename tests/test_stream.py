@@ -0,0 +1,26 @@
+import struct
+import pytest
+from Tools.pyRitoFile import stream
+
+
+@pytest.mark.parametrize('use_numpy', (True, False))
+def test_read_array_same_flat_values(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(stream, 'numpy', None)
+    elif stream.numpy == None:
+        pytest.skip('numpy not installed')
+    floats = [float(i) / 4 for i in range(12)]
+    data = struct.pack('<12f', *floats) + struct.pack('<3H', 1, 2, 65535)
+    bs = stream.BytesStream.reader(data, raw=True)
+    vecs = bs.read_vec3_array(4)
+    assert len(vecs) == 12
+    assert list(vecs) == floats
+    assert list(bs.read_u16_array(3)) == [1, 2, 65535]
+    with pytest.raises(Exception):
+        bs.read_u8_array(1)
+
+
+def test_read_array_unsupported_type():
+    bs = stream.BytesStream.reader(bytes(16), raw=True)
+    with pytest.raises(Exception, match='Unsupported type'):
+        bs.read_array('e', 2)
@@ -0,0 +1,123 @@
+import os, struct, random
+from Tools import wad_tool
+from Tools.pyRitoFile.wad import WAD, WADPatcher
+
+
+def make_wad(tmp_path, files, name='test.wad.client'):
+    # pack {relative path: bytes} into a v3.3 wad
+    raw_dir = tmp_path / 'raw'
+    for path, data in files.items():
+        file_path = raw_dir / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+    wad_file = str(tmp_path / name)
+    wad_tool.pack(str(raw_dir), wad_file)
+    return wad_file
+
+
+def patch_header(wad_file, minor, checksum=None):
+    # set version 3.minor, and every toc checksum if given
+    with open(wad_file, 'r+b') as f:
+        f.seek(3)
+        f.write(bytes((minor,)))
+        f.seek(268)
+        count, = struct.unpack('<I', f.read(4))
+        if checksum != None:
+            for id in range(count):
+                f.seek(272 + id * 32 + 24)
+                f.write(struct.pack('<Q', checksum + id))
+
+
+FILES = {
+    'data/a.bin': b'a' * 1000,
+    'data/b.bin': bytes(range(256)) * 8,
+    'assets/c.dds': b'c' * 10,
+}
+
+
+def test_verify_v3_3_checksums(tmp_path):
+    wad_file = make_wad(tmp_path, FILES)
+    with WAD.open(wad_file) as wad:
+        assert wad.version == 3.3
+        assert wad.verify() == []
+    patch_header(wad_file, 3, checksum=0x1234)
+    with WAD.open(wad_file) as wad:
+        assert [reason for _, reason, _, _ in wad.verify()] == ['checksum'] * len(FILES)
+
+
+def test_verify_v3_0_checksums_are_not_xxh3(tmp_path):
+    # v3.0 toc checksums come from sha256, they must not be checked as xxh3
+    wad_file = make_wad(tmp_path, FILES)
+    patch_header(wad_file, 0, checksum=0x1234)
+    with WAD.open(wad_file) as wad:
+        assert wad.version == 3.0
+        assert wad.verify() == []
+
+
+def test_verify_truncated(tmp_path):
+    wad_file = make_wad(tmp_path, FILES)
+    size = os.path.getsize(wad_file)
+    with open(wad_file, 'r+b') as f:
+        f.truncate(size - 1)
+    with WAD.open(wad_file) as wad:
+        assert [reason for _, reason, _, _ in wad.verify()] == ['truncated']
+
+
+def check_wad(wad_file, expected):
+    # data, non overlapping regions and duplicated flags of every chunk
+    with WAD.open(wad_file) as wad:
+        assert len(wad) == len(expected)
+        file_size = len(wad.bs.buffer)
+        regions = {}
+        for path, data in expected.items():
+            chunk = wad.read_data(path)
+            assert chunk.data == data, path
+            regions.setdefault(chunk.offset, []).append(chunk)
+        end = 272 + 32 * len(wad)
+        for offset in sorted(regions):
+            chunks = regions[offset]
+            assert offset >= end
+            assert len(set(chunk.compressed_size for chunk in chunks)) == 1
+            end = offset + chunks[0].compressed_size
+            for chunk in chunks:
+                assert chunk.duplicated == (len(chunks) > 1)
+        assert end <= file_size
+        return file_size, end
+
+
+def test_patcher_random_replace_and_compact(tmp_path):
+    rng = random.Random(11)
+    paths = [f'data/file{i}.bin' for i in range(24)]
+
+    def random_data():
+        kind = rng.random()
+        if kind < 0.2:
+            # same data as another chunk, should be shared
+            return expected[rng.choice(paths)]
+        if kind < 0.6:
+            return rng.randbytes(rng.randint(1, 4000))
+        return bytes((rng.randint(0, 255),)) * rng.randint(1, 20000)
+
+    expected = {}
+    for path in paths:
+        expected[path] = rng.randbytes(rng.randint(1, 3000))
+    # some chunks share data from the start
+    expected[paths[1]] = expected[paths[0]]
+    expected[paths[2]] = expected[paths[0]]
+    wad_file = make_wad(tmp_path, expected)
+    check_wad(wad_file, expected)
+    for _ in range(30):
+        with WADPatcher(wad_file) as patcher:
+            for _ in range(rng.randint(1, 6)):
+                path = rng.choice(paths)
+                expected[path] = random_data()
+                patcher.replace(path, expected[path])
+        check_wad(wad_file, expected)
+    with WADPatcher(wad_file) as patcher:
+        patcher.compact()
+    file_size, end = check_wad(wad_file, expected)
+    # no gaps left: header + toc + data
+    with WAD.open(wad_file) as wad:
+        regions = set(zip(wad.offsets, wad.compressed_sizes))
+        assert file_size == end == 272 + 32 * len(wad) + sum(size for _, size in regions)
+        assert wad.verify() == []
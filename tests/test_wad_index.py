@@ -0,0 +1,35 @@
+from Tools import wad_tool
+from Tools.wad_index import WADIndex
+
+
+def make_wad(raw_dir, wad_file, files):
+    for path, data in files.items():
+        file_path = raw_dir / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+    wad_tool.pack(str(raw_dir), str(wad_file))
+
+
+def test_update_skips_unreadable_wads(tmp_path):
+    client_dir = tmp_path / 'Game'
+    client_dir.mkdir()
+    make_wad(tmp_path / 'a', client_dir / 'a.wad.client', {'data/a.bin': b'a' * 100})
+    make_wad(tmp_path / 'b', client_dir / 'b.wad.client', {'data/b.bin': b'b' * 100})
+    # truncated inside the toc
+    wad_bytes = (client_dir / 'b.wad.client').read_bytes()
+    (client_dir / 'broken.wad.client').write_bytes(wad_bytes[:280])
+    (client_dir / 'empty.wad.client').write_bytes(b'')
+
+    with WADIndex(str(tmp_path / 'index.db'), client_dir) as index:
+        bad_wads = index.update(jobs=2)
+        assert sorted(bad_wads) == ['broken.wad.client', 'empty.wad.client']
+        assert [wad_file for wad_file, _ in index.find('data/a.bin')] == [str(client_dir / 'a.wad.client').replace('\\', '/')]
+        assert len(index.find('data/b.bin')) == 1
+        assert index.read_data('data/b.bin').data == b'b' * 100
+        indexed = sorted(path for path, in index.db.execute('SELECT path FROM wads'))
+        assert indexed == ['a.wad.client', 'b.wad.client']
+
+        # fixed wad is picked up by the next update
+        (client_dir / 'broken.wad.client').write_bytes(wad_bytes)
+        assert sorted(index.update()) == ['empty.wad.client']
+        assert len(index.find('data/b.bin')) == 2
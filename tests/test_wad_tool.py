@@ -0,0 +1,83 @@
+import os, re, json
+from Tools import wad_tool
+
+
+def test_compile_patterns_glob_is_anchored():
+    match = wad_tool.compile_patterns(['skins/skin2/*', 'ahri.skn'])
+    assert match('skins/skin2/ahri.bin')
+    assert match('AHRI.SKN')
+    assert not match('data/characters/ahri/skins/skin2/ahri.bin')
+    assert not match('xahri.skn')
+    assert not match('data/ahri.skn')
+
+
+def test_compile_patterns_glob_star_cross_dirs():
+    match = wad_tool.compile_patterns(['*.skn', 'data/characters/ahri/**'])
+    assert match('assets/characters/ahri/skins/base/ahri.skn')
+    assert match('data/characters/ahri/skins/skin0.bin')
+    assert not match('data/characters/annie/skins/skin0.bin')
+
+
+def test_compile_patterns_regex_is_searched():
+    match = wad_tool.compile_patterns([re.compile(r'skin2/')])
+    assert match('data/characters/ahri/skins/skin2/ahri.bin')
+    assert not match('data/characters/ahri/skins/skin1/ahri.bin')
+
+
+def write_files(raw_dir, files):
+    for path, data in files.items():
+        file_path = raw_dir / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+
+
+def assert_same_as_full_pack(tmp_path, raw_dir, wad_file):
+    # incremental pack then full pack of the same files, byte for byte
+    wad_tool.pack(str(raw_dir), wad_file, incremental=True)
+    full_file = str(tmp_path / 'full.wad.client')
+    wad_tool.pack(str(raw_dir), full_file)
+    with open(wad_file, 'rb') as f, open(full_file, 'rb') as full:
+        assert f.read() == full.read()
+
+
+def test_pack_incremental_matches_full_pack(tmp_path):
+    raw_dir = tmp_path / 'raw'
+    wad_file = str(tmp_path / 'test.wad.client')
+    files = {f'data/file{i}.bin': bytes((i,)) * (1000 + i) for i in range(8)}
+    files['data/copy.bin'] = files['data/file0.bin']
+    write_files(raw_dir, files)
+    assert_same_as_full_pack(tmp_path, raw_dir, wad_file)
+    # edit
+    write_files(raw_dir, {'data/file1.bin': b'edited' * 100})
+    assert_same_as_full_pack(tmp_path, raw_dir, wad_file)
+    # touch, same data
+    stat = os.stat(raw_dir / 'data/file2.bin')
+    os.utime(raw_dir / 'data/file2.bin', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert_same_as_full_pack(tmp_path, raw_dir, wad_file)
+    # add, same data as another file too
+    write_files(raw_dir, {'data/new.bin': b'new' * 100, 'data/copy2.bin': files['data/file3.bin']})
+    assert_same_as_full_pack(tmp_path, raw_dir, wad_file)
+    # delete, also the source of a copy
+    os.remove(raw_dir / 'data/file0.bin')
+    os.remove(raw_dir / 'data/file4.bin')
+    assert_same_as_full_pack(tmp_path, raw_dir, wad_file)
+
+
+def test_pack_incremental_stale_or_broken_manifest(tmp_path):
+    raw_dir = tmp_path / 'raw'
+    wad_file = str(tmp_path / 'test.wad.client')
+    manifest_file = wad_file + '.manifest.json'
+    write_files(raw_dir, {f'data/file{i}.bin': bytes((i,)) * 1000 for i in range(4)})
+    wad_tool.pack(str(raw_dir), wad_file, incremental=True)
+    # wad changed after the manifest was written: manifest is ignored
+    with open(wad_file, 'ab') as f:
+        f.write(b'junk')
+    write_files(raw_dir, {'data/file1.bin': b'edited'})
+    assert_same_as_full_pack(tmp_path, raw_dir, wad_file)
+    # broken manifest
+    with open(manifest_file, 'w') as f:
+        f.write('{"level": nul')
+    write_files(raw_dir, {'data/file2.bin': b'edited too'})
+    assert_same_as_full_pack(tmp_path, raw_dir, wad_file)
+    with open(manifest_file, 'r') as f:
+        assert json.load(f)['level'] == None